@@ -0,0 +1,124 @@
+import threading
+
+DEFAULT_FRAMES = 4096 # 4096 frames of 4 KB each, 16 MB of pages
+
+"""
+# Keeps at most `capacity` pages backed by page files in memory and evicts the rest with the clock policy.
+# Every access to a page goes through pin/unpin, pinned pages are never evicted and dirty pages are written back when evicted.
+# Pages of tables kept only in memory have nowhere to go, so they are pinned and counted but never take up frames.
+"""
+class BufferPool:
+
+    def __init__(self, capacity=DEFAULT_FRAMES):
+        self.capacity = capacity
+        self.frames = [] # resident pages that can be evicted, in clock order
+        self.hand = 0 # next frame the clock looks at
+        self.lock = threading.Lock()
+        self.wal = None # write-ahead log of the database, flushed before any page is written so the log is always ahead
+
+        # counters for sizing the pool to the working set
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    """
+    # makes sure the page is in memory and keeps it there until unpin is called
+    """
+    def pin(self, page):
+        with self.lock:
+            self.fetch(page)
+
+    def unpin(self, page):
+        with self.lock:
+            page.pin_count -= 1
+
+    # pins several pages under one acquisition of the lock, used when writing a record across all of its columns
+    def pin_all(self, pages):
+        with self.lock:
+            for page in pages:
+                self.fetch(page)
+
+    def unpin_all(self, pages):
+        with self.lock:
+            for page in pages:
+                page.pin_count -= 1
+
+    # loads the page if it isn't resident and pins it. the caller holds the lock
+    def fetch(self, page):
+        if page.is_loaded():
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.make_room()
+            page.load()
+            self.frames.append(page)
+        page.pin_count += 1
+        page.referenced = True
+
+    """
+    # takes a newly allocated page into the pool. the page is already in memory, so it may push another page out
+    """
+    def add(self, page):
+        if page.page_file is None:
+            return
+        with self.lock:
+            self.make_room()
+            self.frames.append(page)
+            page.referenced = True
+
+    # evicts pages until there is a free frame. if every page is pinned the pool is allowed to go over capacity
+    def make_room(self):
+        while len(self.frames) >= self.capacity:
+            if not self.evict():
+                return
+
+    """
+    # runs the clock over the frames and evicts the first unpinned page that hasn't been referenced since the hand last passed it
+    # returns False if every page is pinned
+    """
+    def evict(self):
+        # two sweeps are enough, the first one clears every reference bit
+        for i in range(2 * len(self.frames)):
+            if self.hand >= len(self.frames):
+                self.hand = 0
+            page = self.frames[self.hand]
+            if page.pin_count > 0:
+                self.hand += 1
+            elif page.referenced:
+                page.referenced = False
+                self.hand += 1
+            else:
+                if page.dirty and self.wal is not None:
+                    self.wal.force_all()
+                page.flush() # dirty pages are written back before they leave memory
+                page.unload()
+                # move the last frame into the hole, the hand stays put and looks at it next
+                self.frames[self.hand] = self.frames[-1]
+                self.frames.pop()
+                self.evictions += 1
+                return True
+        return False
+
+    # writes one page back to its page file if it is in memory, without pinning it
+    def write_back(self, page):
+        with self.lock:
+            if page.is_loaded():
+                page.flush()
+
+    """
+    # drops the given pages from the pool without writing them, used once their table has been flushed and closed
+    """
+    def discard(self, pages):
+        pages = set(map(id, pages))
+        with self.lock:
+            self.frames = [page for page in self.frames if id(page) not in pages]
+            self.hand = 0
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'frames_in_use': len(self.frames),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
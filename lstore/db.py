@@ -1,35 +1,179 @@
-from lstore.table import Table
+from lstore.table import Table, DELTA_RECORD, COMPENSATION_RECORD
+from lstore.bufferpool import BufferPool, DEFAULT_FRAMES
+from lstore.lock_manager import LockManager
+from lstore.wal import WriteAheadLog, COMMIT, ABORT
+import json
+import os
+import shutil
+import threading
+
+DATABASE_FILE = 'database.json'
+CHECKPOINT_INTERVAL = 60 # seconds between background checkpoints, recovery replays at most about this much of the log
 
 class Database():
 
-    def __init__(self):
+    """
+    # bufferpool_frames: how many pages the tables of this database may keep in memory at once
+    # checkpoint_interval: seconds between checkpoints while the database is open, None to only checkpoint on close
+    """
+    def __init__(self, bufferpool_frames=DEFAULT_FRAMES, checkpoint_interval=CHECKPOINT_INTERVAL):
         #self.tables = []
         self.tables = {} # dictionary for faster lookup alternative?
+        self.path = None # directory the database is stored in, None until open is called
+        self.bufferpool = BufferPool(bufferpool_frames) # shared by every table
+        self.lock_manager = LockManager() # shared by every table, locks are named after the table
+        self.wal = None # write-ahead log, only kept for databases stored on disk
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_thread = None
+        self.stop_checkpoints = threading.Event()
+        self.checkpoint_lock = threading.Lock() # keeps tables from being created or dropped during a checkpoint
 
-    # Not required for milestone1
+    """
+    # Opens the database stored in the directory at path, creating it if it doesn't exist
+    # tables created after this are stored there too. each table gets its own directory
+    # if the database wasn't closed, the write-ahead log brings the tables up to date (see recover)
+    """
     def open(self, path):
-        pass
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        database_file = os.path.join(path, DATABASE_FILE)
+        clean = True
+        if os.path.exists(database_file):
+            with open(database_file) as f:
+                metadata = json.load(f)
+            for table in metadata['tables']:
+                self.tables[table['name']] = Table(table['name'], table['num_columns'], table['key'], self.table_path(table['name']), self.bufferpool, self.lock_manager)
+            clean = metadata['clean']
+
+        wal = WriteAheadLog(path)
+        records = wal.read()
+        # the log can be empty after a crash too, if the last checkpoint truncated it
+        if records or not clean:
+            self.recover(records)
+        # lsns keep growing across runs, a table's checkpoint lsn must never be ahead of the log
+        wal.next_lsn = max([table.checkpoint_lsn for table in self.tables.values()] + [records[-1][0] + 1 if records else 0])
+        if records:
+            wal.truncate(wal.next_lsn)
+        self.wal = wal
+        self.bufferpool.wal = wal
+        for table in self.tables.values():
+            table.wal = wal
+
+        self.write_metadata(False) # until close says otherwise
+        if self.checkpoint_interval is not None:
+            self.stop_checkpoints.clear()
+            self.checkpoint_thread = threading.Thread(target=self.checkpoint_worker, name='checkpoint', daemon=True)
+            self.checkpoint_thread.start()
+
+    """
+    # fuzzy checkpoint: every table is flushed while transactions keep running, then the log is truncated
+    # up to the oldest checkpoint lsn, or further back if a running transaction wrote records before that
+    """
+    def checkpoint(self):
+        with self.checkpoint_lock:
+            for table in self.tables.values():
+                table.flush()
+            lsn = min([table.checkpoint_lsn for table in self.tables.values()] + [self.wal.next_lsn])
+            self.wal.truncate(self.wal.oldest_active(lsn))
 
+    def checkpoint_worker(self):
+        while not self.stop_checkpoints.wait(self.checkpoint_interval):
+            self.checkpoint()
+
+    """
+    # repeats the logged writes each table's checkpoint doesn't have, then rolls back the writes of transactions
+    # that neither committed nor aborted, newest first. the tables are checkpointed afterwards so the log can be emptied
+    # a transaction that was aborting cancelled its newest deltas already: an abort undoes newest first, so each
+    # compensation record it logged stands for the next of its deltas the backwards walk meets, which is left alone
+    """
+    def recover(self, records):
+        ended = set(record[2] for record in records if record[1] == COMMIT or record[1] == ABORT)
+        for record in records:
+            lsn, record_type, transaction_id = record[:3]
+            if record_type == COMMIT or record_type == ABORT:
+                continue
+            table = self.tables.get(record[3])
+            if table is not None and lsn >= table.checkpoint_lsn:
+                table.redo(record_type, record[4:])
+        compensations = {} # transaction id -> compensation records not matched with a delta yet
+        for record in reversed(records):
+            lsn, record_type, transaction_id = record[:3]
+            if record_type == COMMIT or record_type == ABORT or transaction_id is None or transaction_id in ended:
+                continue
+            table = self.tables.get(record[3])
+            if table is None:
+                continue
+            delta_type = table.delta_type(record_type, record[4:])
+            if delta_type == COMPENSATION_RECORD:
+                compensations[transaction_id] = compensations.get(transaction_id, 0) + 1
+            elif delta_type == DELTA_RECORD and compensations.get(transaction_id):
+                compensations[transaction_id] -= 1
+            else:
+                table.undo(record_type, record[4:])
+        for table in self.tables.values():
+            # the stored indexes only match the tables after a clean close
+            table.index.discard_stored()
+            table.flush()
+
+    """
+    # Writes every table to disk and closes their files
+    """
     def close(self):
-        pass
+        if self.path is None:
+            return
+        if self.checkpoint_thread is not None:
+            self.stop_checkpoints.set()
+            self.checkpoint_thread.join()
+            self.checkpoint_thread = None
+        for table in self.tables.values():
+            table.close()
+        self.write_metadata(True)
+        # every table has been checkpointed, nothing in the log is needed anymore
+        self.wal.truncate(self.wal.next_lsn)
+        self.wal.close()
+        self.wal = None
+        self.bufferpool.wal = None
+        self.tables = {}
+
+    # writes the list of tables to DATABASE_FILE. clean: whether the database was closed, if not the next open recovers it
+    def write_metadata(self, clean=False):
+        metadata = {
+            'tables': [{'name': table.name, 'num_columns': table.num_columns, 'key': table.key} for table in self.tables.values()],
+            'clean': clean,
+        }
+        with open(os.path.join(self.path, DATABASE_FILE + '.tmp'), 'w') as f:
+            json.dump(metadata, f)
+        os.replace(os.path.join(self.path, DATABASE_FILE + '.tmp'), os.path.join(self.path, DATABASE_FILE))
+
+    # directory the table with the given name is stored in, None if the database isn't stored on disk
+    def table_path(self, name):
+        if self.path is None:
+            return None
+        return os.path.join(self.path, name)
 
     """
     # Creates a new table
     :param name: string         #Table name
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key: int             #Index of table key in columns
+    :param cumulative: bool     #Whether tail records carry every updated column, see Table
     """
-    def create_table(self, name, num_columns, key_index):
+    def create_table(self, name, num_columns, key_index, cumulative=False):
 
         # Prevent duplicate table names 
         if self.get_table(name) is not None:
             print(f"dupe table name: '{name}' already exists")
             return None
 
-        table = Table(name, num_columns, key_index)
+        table = Table(name, num_columns, key_index, self.table_path(name), self.bufferpool, self.lock_manager, self.wal, cumulative)
         #self.tables.append(table)
 
-        self.tables[name] = table # dictionary alternative
+        with self.checkpoint_lock:
+            self.tables[name] = table # dictionary alternative
+        if self.path is not None:
+            # the table is checkpointed right away, so recovery knows it exists and skips log records of any older table of the same name
+            table.flush()
+            self.write_metadata()
 
         return table # assuming it wants the table returned instead of boolean
 
@@ -44,7 +188,12 @@ class Database():
             return False
         #self.tables.remove(table)
 
-        del self.tables[name]  # dictionary alternative
+        with self.checkpoint_lock:
+            del self.tables[name]  # dictionary alternative
+            if self.path is not None: # remove the table's files too
+                table.close()
+                shutil.rmtree(self.table_path(name), ignore_errors=True)
+                self.write_metadata()
 
         return True
 
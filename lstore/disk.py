@@ -0,0 +1,53 @@
+import mmap
+import os
+
+from lstore.page import CAPACITY
+
+"""
+# A file holding every page of one column of a table. page number n lives at byte offset n * CAPACITY
+# pages are read through a read-only memory map, so opening a table never reads pages it doesn't touch
+"""
+class PageFile:
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.map = None
+        self.map_size = 0
+
+    # (re)map the file. only needed when the page we want lies past the end of the current mapping
+    def remap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.map_size = os.fstat(self.fd).st_size
+        if self.map_size > 0:
+            self.map = mmap.mmap(self.fd, self.map_size, access=mmap.ACCESS_READ)
+
+    """
+    # returns a fresh bytearray holding the contents of the given page
+    # pages that were never written come back zeroed
+    """
+    def read_page(self, page_number):
+        offset = page_number * CAPACITY
+        data = bytearray(CAPACITY)
+        if offset + CAPACITY > self.map_size:
+            self.remap()
+            if offset + CAPACITY > self.map_size:
+                return data
+        # copy straight out of the mapping, the view is released right away so the map can be closed or remapped later
+        with memoryview(self.map) as view:
+            data[:] = view[offset:offset + CAPACITY]
+        return data
+
+    def write_page(self, page_number, data):
+        os.pwrite(self.fd, data, page_number * CAPACITY)
+
+    def sync(self):
+        os.fsync(self.fd)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        os.close(self.fd)
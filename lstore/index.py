@@ -4,66 +4,372 @@ Key column should be indexd by default, other columns can be indexed through thi
 Indices are usually B-Trees, but other data structures can be used as well.
 """
 
-B_TREE_DEGREE = 100 # can be adjusted later, controls the amount of children a BTreeNode can have
+from bisect import bisect_left, bisect_right
+import os
+import pickle
+import threading
+
+B_TREE_DEGREE = 100 # can be adjusted later, a node holds up to 2 * B_TREE_DEGREE - 1 keys
+
+# index types that can be created on a column
+BTREE_INDEX = 'btree' # ordered, answers both point and range lookups
+HASH_INDEX = 'hash' # O(1) point lookups only
+
+DEFERRED_BATCH_SIZE = 1024 # buffered changes per column before they are applied in deferred mode
+INSERT = 1
+REMOVE = 0
+
+POSTING_LIST_LIMIT = 16 # posting lists longer than this become sets, so removing a RID from a popular value stays O(1)
+
+"""
+# posting helpers shared by both index types. postings is a leaf's rids list or a hash index's map, key the position or value
+"""
+def add_to_posting(postings, key, RID):
+    rids = postings[key]
+    if type(rids) is set:
+        rids.add(RID)
+    else:
+        rids.append(RID)
+        if len(rids) > POSTING_LIST_LIMIT:
+            postings[key] = set(rids)
+
+# returns True if the posting is empty afterwards
+def remove_from_posting(postings, key, RID):
+    rids = postings[key]
+    if type(rids) is set:
+        rids.discard(RID)
+    elif RID in rids:
+        rids.remove(RID)
+    return len(rids) == 0
 
 class Index:
 
     def __init__(self, table):
+        self.table = table
+        self.key = table.key
+        # taken by every index operation, the trees aren't safe to change from several transaction threads at once
+        self.latch = threading.RLock()
+
+        # deferred mode: changes to non-key columns caused by updates and deletes are buffered per column and
+        # applied in sorted batches, either once DEFERRED_BATCH_SIZE pile up or right before the column is searched
+        self.deferred = False
+        self.pending = [[] for i in range(table.num_columns)] # (value, INSERT or REMOVE, RID)
+
+        # indexes stored on disk that haven't been needed since the table was opened: (column, index type) -> file
+        self.unloaded = {}
+        self.version = None # version the stored index files must carry to be used
+
         # One index for each table. All our empty initially.
-        self.indices = [None] *  table.num_columns
+        self.indices = [None] *  table.num_columns # ordered indexes
+        self.hash_indices = [None] * table.num_columns
         for i in range(table.num_columns):
             self.create_index(i)
+        # the primary key is looked up by every insert, update, delete and select, so it also gets a hash index
+        self.create_index(table.key, HASH_INDEX)
 
     """
     # returns the location of all records with the given value on column "column"
+    # uses the column's hash index if it has one
     """
 
     def locate(self, column, value):
-        RIDs = [] # will contain the list of all RIDs associated with the value
-        btree = self.indices[column]
-        root = btree.root
-        btree.BtreeSearch(root, value, RIDs)
-        return RIDs
+        with self.latch:
+            if self.unloaded:
+                self.load_column(column)
+            if self.pending[column]:
+                self.apply_pending(column)
+            index = self.hash_indices[column]
+            if index is None:
+                index = self.indices[column]
+            if index is None: # column isn't indexed, look at every record
+                return self.scan(value, value, column)
+            return index.search(value) # the list of all RIDs associated with the value
 
     """
     # Returns the RIDs of all records with values in column "column" between "begin" and "end"
+    # uses the column's ordered index if it has one, a hash index has to be scanned
     """
 
     def locate_range(self, begin, end, column):
-        RIDs = [] # will contain the list of all RIDs associated with the values in the range of begin and end, inclusive to both
-        btree = self.indices[column]
-        root = btree.root
-        btree.BtreeSearchRange(root, begin, end, RIDs)
-        return RIDs
+        with self.latch:
+            if self.unloaded:
+                self.load_column(column)
+            if self.pending[column]:
+                self.apply_pending(column)
+            index = self.indices[column]
+            if index is None:
+                index = self.hash_indices[column]
+            if index is None: # column isn't indexed, look at every record
+                return self.scan(begin, end, column)
+            return index.search_range(begin, end) # all RIDs associated with the values in the range of begin and end, inclusive to both
 
     """
     # insert a record from a given column into the index
     """
     def insert_record(self, RID, value, column):
-        key = (value, RID)
-        self.indices[column].insert(key)
+        with self.latch:
+            if self.unloaded:
+                self.load_column(column)
+            if self.indices[column] is not None:
+                self.indices[column].insert(value, RID)
+            if self.hash_indices[column] is not None:
+                self.hash_indices[column].insert(value, RID)
+
+    """
+    # remove a record's entry from the indexes of a given column
+    """
+    def remove_record(self, RID, value, column):
+        with self.latch:
+            if self.unloaded:
+                self.load_column(column)
+            if self.indices[column] is not None:
+                self.indices[column].delete(value, RID)
+            if self.hash_indices[column] is not None:
+                self.hash_indices[column].delete(value, RID)
+
+    """
+    # move a record from old_value to new_value in the indexes of a given column, called when an update changes the column
+    """
+    def update_record(self, RID, old_value, new_value, column):
+        with self.latch:
+            if old_value == new_value or not self.is_indexed(column):
+                return
+            if self.deferred and column != self.key:
+                pending = self.pending[column]
+                pending.append((old_value, REMOVE, RID))
+                pending.append((new_value, INSERT, RID))
+                if len(pending) >= DEFERRED_BATCH_SIZE:
+                    self.apply_pending(column)
+                return
+            self.remove_record(RID, old_value, column)
+            self.insert_record(RID, new_value, column)
+
+    """
+    # remove a deleted record from the indexes of a given column
+    """
+    def delete_record(self, RID, value, column):
+        with self.latch:
+            if not self.is_indexed(column):
+                return
+            if self.deferred and column != self.key:
+                self.pending[column].append((value, REMOVE, RID))
+                if len(self.pending[column]) >= DEFERRED_BATCH_SIZE:
+                    self.apply_pending(column)
+                return
+            self.remove_record(RID, value, column)
+
+    def is_indexed(self, column):
+        with self.latch:
+            if self.unloaded:
+                self.load_column(column)
+            return self.indices[column] is not None or self.hash_indices[column] is not None
+
+    """
+    # turn deferred index maintenance on or off. turning it off applies whatever is still buffered
+    """
+    def set_deferred(self, deferred):
+        with self.latch:
+            self.deferred = deferred
+            if not deferred:
+                for column in range(len(self.pending)):
+                    self.apply_pending(column)
+
+    """
+    # apply the buffered changes of a column, sorted by value so the tree is walked in order
+    # the sort is stable, so changes to the same value keep the order they were made in
+    """
+    def apply_pending(self, column):
+        with self.latch:
+            pending = self.pending[column]
+            if not pending:
+                return
+            self.pending[column] = []
+            pending.sort(key=lambda change: change[0])
+            for value, operation, RID in pending:
+                if operation == INSERT:
+                    self.insert_record(RID, value, column)
+                else:
+                    self.remove_record(RID, value, column)
 
     """
     # optional: Create index on specific column
+    # index_type: BTREE_INDEX or HASH_INDEX. a column can have one of each
+    # on a populated table the latest value of every live record is read once and the index is built in one go:
+    # a B+ tree is bulk loaded bottom-up from the sorted values instead of inserting records one by one
     """
 
-    def create_index(self, column_number):
-        self.indices[column_number] = BTree(B_TREE_DEGREE)
+    def create_index(self, column_number, index_type=BTREE_INDEX):
+        with self.latch:
+            self.unloaded.pop((column_number, index_type), None) # the stored copy, if any, is replaced
+            # buffered changes go to every index of the column, apply them before the new index is built from the current values
+            self.apply_pending(column_number)
+            RIDs, values = self.column_entries(column_number)
+            if index_type == HASH_INDEX:
+                index = HashIndex()
+                for RID, value in zip(RIDs, values):
+                    index.insert(value, RID)
+                self.hash_indices[column_number] = index
+            else:
+                index = BPlusTree(B_TREE_DEGREE)
+                index.bulk_load(sorted(zip(values, RIDs)))
+                self.indices[column_number] = index
 
     """
     # optional: Drop index of specific column
+    # index_type: BTREE_INDEX or HASH_INDEX, None drops both. searches on a column without an index scan the table
+    """
+
+    def drop_index(self, column_number, index_type=None):
+        with self.latch:
+            self.apply_pending(column_number) # the other index of the column may still need them
+            if index_type is None or index_type == BTREE_INDEX:
+                self.indices[column_number] = None
+                self.unloaded.pop((column_number, BTREE_INDEX), None)
+            if index_type is None or index_type == HASH_INDEX:
+                self.hash_indices[column_number] = None
+                self.unloaded.pop((column_number, HASH_INDEX), None)
+
+    """
+    # rebuilds every existing index from the table's records
+    """
+    def rebuild(self):
+        for column in range(len(self.indices)):
+            if self.indices[column] is not None:
+                self.create_index(column, BTREE_INDEX)
+            if self.hash_indices[column] is not None:
+                self.create_index(column, HASH_INDEX)
+
+    """
+    # lists the indexes that exist as [column, index type] pairs, for the table's metadata
+    """
+    def describe(self):
+        with self.latch:
+            indexes = []
+            for column in range(len(self.indices)):
+                for index_type in (BTREE_INDEX, HASH_INDEX):
+                    if self.get_index(column, index_type) is not None or (column, index_type) in self.unloaded:
+                        indexes.append([column, index_type])
+            return indexes
+
+    def get_index(self, column, index_type):
+        return self.indices[column] if index_type == BTREE_INDEX else self.hash_indices[column]
+
+    # file an index is stored in
+    def index_file(self, path, column, index_type):
+        return os.path.join(path, 'index_%d_%s.idx' % (column, index_type))
+
+    """
+    # writes every index to its own file in path, stamped with version
+    # a B+ tree is stored as its sorted run of values and posting lists, so loading it is a bulk load without sorting
+    """
+    def save(self, path, version):
+        with self.latch:
+            for column in range(len(self.indices)):
+                self.load_column(column) # an index that was never loaded still has to carry the new version
+                self.apply_pending(column)
+                for index_type in (BTREE_INDEX, HASH_INDEX):
+                    index = self.get_index(column, index_type)
+                    if index is None:
+                        continue
+                    contents = index.to_run() if index_type == BTREE_INDEX else index.map
+                    with open(self.index_file(path, column, index_type) + '.tmp', 'wb') as f:
+                        pickle.dump((version, contents), f, pickle.HIGHEST_PROTOCOL)
+                    os.replace(self.index_file(path, column, index_type) + '.tmp', self.index_file(path, column, index_type))
+
     """
+    # called when the table is opened. indexes: [column, index type] pairs from describe
+    # nothing is read yet, each index is loaded from its file the first time its column is used.
+    # an index file whose version doesn't match the table's (or that is missing) is stale and gets rebuilt from the records instead
+    """
+    def load(self, path, version, indexes):
+        with self.latch:
+            self.indices = [None] * len(self.indices)
+            self.hash_indices = [None] * len(self.hash_indices)
+            self.version = version
+            self.unloaded = {}
+            for column, index_type in indexes:
+                self.unloaded[(column, index_type)] = self.index_file(path, column, index_type)
+
+    """
+    # the stored index files no longer match the table, every index is rebuilt from the records when it is first used
+    """
+    def discard_stored(self):
+        with self.latch:
+            self.version = None
 
-    def drop_index(self, column_number):
-        pass
+    def load_column(self, column):
+        for index_type in (BTREE_INDEX, HASH_INDEX):
+            index_file = self.unloaded.pop((column, index_type), None)
+            if index_file is None:
+                continue
+            stored = None
+            if os.path.exists(index_file):
+                with open(index_file, 'rb') as f:
+                    stored = pickle.load(f)
+            if stored is None or stored[0] != self.version:
+                self.create_index(column, index_type)
+            elif index_type == BTREE_INDEX:
+                index = BPlusTree(B_TREE_DEGREE)
+                index.load_run(*stored[1])
+                self.indices[column] = index
+            else:
+                index = HashIndex()
+                index.map = stored[1]
+                self.hash_indices[column] = index
 
-# Source: https://www.geeksforgeeks.org/dsa/b-tree-in-python/. Code is a modified version of GeeksforGeeks's.
-class BTreeNode:
+    # returns the RIDs of the table's live records and the latest value of the given column for each
+    def column_entries(self, column):
+        if self.table.RID_counter == 0:
+            return [], []
+        RIDs = self.table.live_RIDs()
+        return RIDs, self.table.get_column_values(RIDs, column)
+
+    # finds the records with values in [begin, end] in a column that has no index by reading every record
+    def scan(self, begin, end, column):
+        RIDs, values = self.column_entries(column)
+        return [RID for RID, value in zip(RIDs, values) if begin <= value <= end]
+
+"""
+# A hash index, maps each value to the list of RIDs that have it
+"""
+class HashIndex:
+    def __init__(self):
+        self.map = {}
+
+    def search(self, value):
+        return list(self.map.get(value, ()))
+
+    # no order to follow, every value has to be checked
+    def search_range(self, begin, end):
+        RIDs = []
+        for value, rids in self.map.items():
+            if begin <= value <= end:
+                RIDs.extend(rids)
+        return RIDs
+
+    def insert(self, value, RID):
+        if value in self.map:
+            add_to_posting(self.map, value, RID)
+        else:
+            self.map[value] = [RID]
+
+    # removes RID from the posting list of value. the value goes away with its last RID
+    def delete(self, value, RID):
+        if value in self.map and remove_from_posting(self.map, value, RID):
+            del self.map[value]
+
+"""
+# A B+ tree node. internal nodes only route: child[i] holds the values below keys[i], child[i + 1] the values from keys[i] on
+# leaves hold every value once, with the RIDs that have it as a posting list (a set once it gets long) in the same position of rids,
+# and are linked left to right through next for range scans
+"""
+class BPlusTreeNode:
     def __init__(self, leaf=False):
         self.leaf = leaf
-        # store a tuple in the format (value, RID) in keys
         self.keys = []
-        self.child = []
+        self.child = [] # internal nodes only
+        self.rids = [] # leaves only, rids[i] is the list of RIDs with value keys[i]
+        self.next = None # leaves only, the leaf to the right
 
     def display(self, level=0):
         print(f"Level {level}: {self.keys}")
@@ -71,218 +377,164 @@ class BTreeNode:
             for child in self.child:
                 child.display(level + 1)
 
-class BTree:
+class BPlusTree:
     def __init__(self, t):
-        self.root = BTreeNode(True)
+        self.root = BPlusTreeNode(True)
         self.t = t
+        self.max_keys = (2 * t) - 1
 
     def display(self):
         self.root.display()
 
-    # k is the key we want to insert. k is a tuple of the format (value, RID)
-    def insert(self, k):
-        root = self.root
-        if len(root.keys) == (2 * self.t) - 1:
-            temp = BTreeNode()
-            self.root = temp
-            temp.child.append(root)
-            self.split_child(temp, 0)
-            self.insert_non_full(temp, k)
-        else:
-            self.insert_non_full(root, k)
-
-    # x is the node we want to insert the key k into
-    def insert_non_full(self, x, k):
-        i = len(x.keys) - 1
-        if x.leaf:
-            x.keys.append(None)  # Make space for the new key
-            while i >= 0 and k[0] < x.keys[i][0]:
-                x.keys[i + 1] = x.keys[i]
-                i -= 1
-            x.keys[i + 1] = k
-        else:
-            while i >= 0 and k[0] < x.keys[i][0]:
-                i -= 1
-            i += 1
-            if len(x.child[i].keys) == (2 * self.t) - 1:
-                self.split_child(x, i)
-                if k[0] > x.keys[i][0]:
-                    i += 1
-            self.insert_non_full(x.child[i], k)
-
-    # Split the child
-    def split_child(self, x, i):
-        t = self.t
-        y = x.child[i]
-        z = BTreeNode(y.leaf)
-        x.child.insert(i + 1, z)
-        x.keys.insert(i, y.keys[t - 1])
-        z.keys = y.keys[t: (2 * t) - 1]
-        y.keys = y.keys[0: t - 1]
-        if not y.leaf:
-            z.child = y.child[t: 2 * t]
-            y.child = y.child[0: t]
-    
-    # Delete a node
-    # x: the node we are currently searching for the key
-    # k: the key we want to delete
-    def delete(self, x, k):
-        t = self.t
-        i = 0
-        while i < len(x.keys) and k[0] > x.keys[i][0]:
-            i += 1
-        if x.leaf:
-            if i < len(x.keys) and x.keys[i] == k:
-                x.keys.pop(i)
-                return
-            return
+    # returns the leaf that holds (or would hold) the value
+    def find_leaf(self, value):
+        x = self.root
+        while not x.leaf:
+            x = x.child[bisect_right(x.keys, value)]
+        return x
 
-        if i < len(x.keys) and x.keys[i] == k:
-            return self.delete_internal_node(x, k, i)
-        elif len(x.child[i].keys) >= t:
-            self.delete(x.child[i], k)
-        else:
-            if i != 0 and i + 2 < len(x.child):
-                if len(x.child[i - 1].keys) >= t:
-                    self.delete_sibling(x, i, i - 1)
-                elif len(x.child[i + 1].keys) >= t:
-                    self.delete_sibling(x, i, i + 1)
-                else:
-                    self.delete_merge(x, i, i + 1)
-            elif i == 0:
-                if len(x.child[i + 1].keys) >= t:
-                    self.delete_sibling(x, i, i + 1)
-                else:
-                    self.delete_merge(x, i, i + 1)
-            elif i + 1 == len(x.child):
-                if len(x.child[i - 1].keys) >= t:
-                    self.delete_sibling(x, i, i - 1)
-                else:
-                    self.delete_merge(x, i, i - 1)
-            self.delete(x.child[i], k)
-
-    # Delete internal node
-    def delete_internal_node(self, x, k, i):
-        t = self.t
-        if x.leaf:
-            if x.keys[i] == k:
-                x.keys.pop(i)
-                return
+    # finds all RIDs associated to the value
+    def search(self, value):
+        leaf = self.find_leaf(value)
+        i = bisect_left(leaf.keys, value)
+        if i < len(leaf.keys) and leaf.keys[i] == value:
+            return list(leaf.rids[i])
+        return []
+
+    # finds all RIDs with values in the interval [begin, end] (inclusive to both begin and end) by walking the linked leaves
+    def search_range(self, begin, end):
+        RIDs = []
+        leaf = self.find_leaf(begin)
+        i = bisect_left(leaf.keys, begin)
+        while leaf is not None:
+            keys = leaf.keys
+            while i < len(keys):
+                if keys[i] > end:
+                    return RIDs
+                RIDs.extend(leaf.rids[i])
+                i += 1
+            leaf = leaf.next
+            i = 0
+        return RIDs
+
+    """
+    # replaces the tree with one built bottom-up from entries, a list of (value, RID) sorted by value
+    # leaves are filled to 3/4 so the inserts that follow don't split every one of them right away
+    """
+    def bulk_load(self, entries):
+        keys = []
+        postings = []
+        for value, RID in entries:
+            if keys and keys[-1] == value:
+                add_to_posting(postings, len(postings) - 1, RID)
+            else:
+                keys.append(value)
+                postings.append([RID])
+        self.load_run(keys, postings)
+
+    """
+    # builds the tree from a sorted run: every distinct value in order and the posting list of each
+    """
+    def load_run(self, keys, postings):
+        fill = max(2, (self.max_keys * 3) // 4)
+        level = [] # nodes of the level being built, left to right
+        lows = [] # smallest value under each node of the level
+        for start in range(0, len(keys), fill):
+            leaf = BPlusTreeNode(True)
+            leaf.keys = keys[start:start + fill]
+            leaf.rids = postings[start:start + fill]
+            if level:
+                level[-1].next = leaf
+            level.append(leaf)
+            lows.append(leaf.keys[0])
+        if not level:
+            self.root = BPlusTreeNode(True)
             return
 
-        if len(x.child[i].keys) >= t:
-            x.keys[i] = self.delete_predecessor(x.child[i])
+        # each internal node routes fill + 1 children, separated by the smallest value of every child but the first
+        while len(level) > 1:
+            parents = []
+            parent_lows = []
+            for start in range(0, len(level), fill + 1):
+                node = BPlusTreeNode()
+                node.child = level[start:start + fill + 1]
+                node.keys = lows[start + 1:start + fill + 1]
+                parents.append(node)
+                parent_lows.append(lows[start])
+            level = parents
+            lows = parent_lows
+        self.root = level[0]
+
+    """
+    # returns the tree's sorted run (values in order and their posting lists) by walking the linked leaves
+    """
+    def to_run(self):
+        keys = []
+        postings = []
+        leaf = self.root
+        while not leaf.leaf:
+            leaf = leaf.child[0]
+        while leaf is not None:
+            keys.extend(leaf.keys)
+            postings.extend(leaf.rids)
+            leaf = leaf.next
+        return keys, postings
+
+    # adds RID to the posting list of value, splitting full nodes on the way back up
+    def insert(self, value, RID):
+        path = [] # (node, child index) pairs from the root down to the leaf
+        x = self.root
+        while not x.leaf:
+            i = bisect_right(x.keys, value)
+            path.append((x, i))
+            x = x.child[i]
+
+        i = bisect_left(x.keys, value)
+        if i < len(x.keys) and x.keys[i] == value:
+            add_to_posting(x.rids, i, RID) # duplicate value, only the posting list grows
             return
-        elif len(x.child[i + 1].keys) >= t:
-            x.keys[i] = self.delete_successor(x.child[i + 1])
+        x.keys.insert(i, value)
+        x.rids.insert(i, [RID])
+        if len(x.keys) <= self.max_keys:
             return
-        else:
-            self.delete_merge(x, i, i + 1)
-            self.delete_internal_node(x.child[i], k, self.t - 1)
-
-    # Delete the predecessor
-    def delete_predecessor(self, x):
-        if x.leaf:
-            return x.keys.pop()
-        n = len(x.keys) - 1
-        if len(x.child[n].keys) >= self.t:
-            self.delete_sibling(x, n + 1, n)
-        else:
-            self.delete_merge(x, n, n + 1)
-        self.delete_predecessor(x.child[n])
-
-    # Delete the successor
-    def delete_successor(self, x):
-        if x.leaf:
-            return x.keys.pop(0)
-        if len(x.child[1].keys) >= self.t:
-            self.delete_sibling(x, 0, 1)
-        else:
-            self.delete_merge(x, 0, 1)
-        self.delete_successor(x.child[0])
-
-    # Delete resolution
-    def delete_merge(self, x, i, j):
-        cnode = x.child[i]
-
-        if j > i:
-            rsnode = x.child[j]
-            cnode.keys.append(x.keys[i])
-            for k in range(len(rsnode.keys)):
-                cnode.keys.append(rsnode.keys[k])
-                if len(rsnode.child) > 0:
-                    cnode.child.append(rsnode.child[k])
-            if len(rsnode.child) > 0:
-                cnode.child.append(rsnode.child.pop())
-            new = cnode
-            x.keys.pop(i)
-            x.child.pop(j)
-        else:
-            lsnode = x.child[j]
-            lsnode.keys.append(x.keys[j])
-            for i in range(len(cnode.keys)):
-                lsnode.keys.append(cnode.keys[i])
-                if len(lsnode.child) > 0:
-                    lsnode.child.append(cnode.child[i])
-            if len(lsnode.child) > 0:
-                lsnode.child.append(cnode.child.pop())
-            new = lsnode
-            x.keys.pop(j)
-            x.child.pop(i)
-
-        if x == self.root and len(x.keys) == 0:
-            self.root = new
-
-    # Delete the sibling
-    def delete_sibling(self, x, i, j):
-        cnode = x.child[i]
-        if i < j:
-            rsnode = x.child[j]
-            cnode.keys.append(x.keys[i])
-            x.keys[i] = rsnode.keys[0]
-            if len(rsnode.child) > 0:
-                cnode.child.append(rsnode.child[0])
-                rsnode.child.pop(0)
-            rsnode.keys.pop(0)
-        else:
-            lsnode = x.child[j]
-            cnode.keys.insert(0, x.keys[i - 1])
-            x.keys[i - 1] = lsnode.keys.pop()
-            if len(lsnode.child) > 0:
-                cnode.child.insert(0, lsnode.child.pop())
-
-    # Source: https://www.geeksforgeeks.org/dsa/introduction-of-b-tree-2/. Made modifications to fit the project.
-    # x: node we are searching
-    # k: the key we are looking for
-    # RIDs: the running list of all RIDs
-    # finds all RIDs associated to the value k (not a tuple)
-    def BtreeSearch(self, x, k, RIDs):
-        i = 0 # the index of the child to recurse into
-        # look for the child we need to recurse into
-        while i < len(x.keys) and k > x.keys[i][0]:
-            i += 1
-        # actually search the keys for values
-        for j in range(len(x.keys)):
-            if k == x.keys[j][0]:
-                RIDs.append(x.keys[j][1]) # store the RID
-        if x.leaf:
-            return None
-        return self.BtreeSearch(x.child[i], k, RIDs)
-    
-    # x: node we are searching
-    # k: the key we are looking for
-    # RIDs: the running list of all RIDs
-    # finds all RIDs with values in the interval [begin, end] (inclusive to both begin and end)
-    # note: can probably be optimized further for performance
-    def BtreeSearchRange(self, x, begin, end, RIDs):
-        j = 0
-        # find the first key that is >= begin
-        while j < len(x.keys) and x.keys[j][0] < begin:
-            j += 1
-        for i in range(j, len(x.keys)):
-            if not x.leaf:
-                self.BtreeSearchRange(x.child[i], begin, end, RIDs) # need to search every child that is also within the range
-            if begin <= x.keys[i][0] <= end:
-                RIDs.append(x.keys[i][1]) # store the RID
-        if not x.leaf:
-            return self.BtreeSearchRange(x.child[len(x.child)-1], begin, end, RIDs) # need to go one past the last node for some cases
+
+        # split the leaf, the first value of the new right leaf is copied up as the separator
+        mid = len(x.keys) // 2
+        right = BPlusTreeNode(True)
+        right.keys = x.keys[mid:]
+        right.rids = x.rids[mid:]
+        x.keys = x.keys[:mid]
+        x.rids = x.rids[:mid]
+        right.next = x.next
+        x.next = right
+        separator = right.keys[0]
+
+        # push the separator up, splitting internal nodes that overflow
+        while path:
+            parent, i = path.pop()
+            parent.keys.insert(i, separator)
+            parent.child.insert(i + 1, right)
+            if len(parent.keys) <= self.max_keys:
+                return
+            mid = len(parent.keys) // 2
+            separator = parent.keys[mid]
+            right = BPlusTreeNode()
+            right.keys = parent.keys[mid + 1:]
+            right.child = parent.child[mid + 1:]
+            parent.keys = parent.keys[:mid]
+            parent.child = parent.child[:mid + 1]
+
+        # the root split, grow the tree by one level
+        root = BPlusTreeNode()
+        root.keys = [separator]
+        root.child = [self.root, right]
+        self.root = root
+
+    # removes RID from the posting list of value. the value goes away with its last RID
+    # nodes are not rebalanced, an underfull leaf only costs a little space and searches skip empty ones
+    def delete(self, value, RID):
+        leaf = self.find_leaf(value)
+        i = bisect_left(leaf.keys, value)
+        if i < len(leaf.keys) and leaf.keys[i] == value and remove_from_posting(leaf.rids, i, RID):
+            leaf.keys.pop(i)
+            leaf.rids.pop(i)
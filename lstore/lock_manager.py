@@ -0,0 +1,79 @@
+import threading
+
+# lock modes
+SHARED = 'S' # reading a record, any number of transactions can hold it together
+EXCLUSIVE = 'X' # inserting, updating or deleting a record, only one transaction
+INCREMENT = 'I' # adding to a column without reading it, increments commute so any number of transactions can hold it together
+
+NUM_STRIPES = 64 # independent parts of the lock table, each with its own latch
+
+class LockManager:
+
+    """
+    # record locks for strict two phase locking. a lock is named by (table name, primary key) so an insert
+    # locks its key before the record exists and two inserts of the same key can't both go through
+    # no-wait: a request that conflicts with a lock another transaction holds fails right away and the transaction aborts,
+    # so nothing ever waits and there are no deadlocks to detect
+    # the lock table is split into stripes by the hash of the lock name, so workers locking different records rarely share a latch
+    # a transaction that takes all of its locks up front, in one global order, can wait for them instead (see acquire)
+    """
+    def __init__(self, num_stripes=NUM_STRIPES):
+        self.num_stripes = num_stripes
+        self.latches = [threading.Condition(threading.Lock()) for i in range(num_stripes)] # notified when a lock of the stripe is released
+        self.locks = [{} for i in range(num_stripes)] # lock name -> [set of shared holders, exclusive holder or None, set of increment holders]
+
+    """
+    # gives transaction the lock on name in the given mode, returns False if another transaction holds a conflicting one
+    # a transaction that is the only holder of a shared lock can upgrade it to exclusive
+    # shared and increment locks exclude each other (a reader would see increments that may still be rolled back),
+    # a transaction holding one can still take the other if nobody else holds it
+    # wait: block until the lock is free instead of failing. waiting can't deadlock as long as every transaction that
+    # waits asks for its locks in the same order and doesn't wait for an upgrade
+    """
+    def acquire(self, transaction, name, mode, wait=False):
+        stripe = hash(name) % self.num_stripes
+        with self.latches[stripe]:
+            while True:
+                lock = self.locks[stripe].get(name)
+                if lock is None:
+                    lock = [set(), None, set()]
+                    self.locks[stripe][name] = lock
+                shared, exclusive, increment = lock
+                # whether the other transactions hold no shared or no increment lock
+                unshared = not shared or (len(shared) == 1 and transaction in shared)
+                unincremented = not increment or (len(increment) == 1 and transaction in increment)
+                if exclusive is not None:
+                    if exclusive is transaction:
+                        return True
+                elif mode == SHARED and unincremented:
+                    shared.add(transaction)
+                    return True
+                elif mode == INCREMENT and unshared:
+                    increment.add(transaction)
+                    return True
+                elif mode == EXCLUSIVE and unshared and unincremented:
+                    shared.discard(transaction)
+                    increment.discard(transaction)
+                    lock[1] = transaction
+                    return True
+                if not wait:
+                    return False
+                self.latches[stripe].wait()
+
+    """
+    # releases every lock transaction holds in names, called when it commits or aborts
+    """
+    def release(self, transaction, names):
+        for name in names:
+            stripe = hash(name) % self.num_stripes
+            with self.latches[stripe]:
+                lock = self.locks[stripe].get(name)
+                if lock is None:
+                    continue
+                lock[0].discard(transaction)
+                lock[2].discard(transaction)
+                if lock[1] is transaction:
+                    lock[1] = None
+                if not lock[0] and lock[1] is None and not lock[2]:
+                    del self.locks[stripe][name]
+                self.latches[stripe].notify_all()
@@ -1,90 +1,248 @@
 # from lstore.table import Record
-import struct
 
 CAPACITY = 4096
 MANDATORY_COLUMNS = 4
 MAX_BASE_PAGES = 16
 ENTRY_SIZE = 8 # 8 bytes
+RECORDS_PER_PAGE = CAPACITY // ENTRY_SIZE # every entry is a signed 64 bit integer
 
 class Page:
 
-    def __init__(self):
-        self.num_records = 0
-        self.data = bytearray(4096)
-        self.page_number = 0
-        self.page_size = 0
-        
-    def has_capacity(self, size):
-        return self.page_size + size < CAPACITY
+    """
+    # page_number: where the page lives in its column's page file
+    # page_file: the PageFile backing this page, None for tables that are only kept in memory
+    # num_records: how many records the page already holds. a page that already holds records is read from its page file the first time it is touched
+    """
+    def __init__(self, page_number=0, page_file=None, num_records=0):
+        self.num_records = num_records
+        self.page_number = page_number
+        self.page_file = page_file
+        self.dirty = False # set when the page has changes that its page file doesn't have yet
+        self.pin_count = 0 # number of users currently holding the page, the bufferpool never evicts a pinned page
+        self.referenced = False # clock bit, set on every pin
+        self.data = None
+        # typed 64-bit view over data, slot i covers bytes [i * ENTRY_SIZE, (i + 1) * ENTRY_SIZE)
+        # reads and writes go through this view so no intermediate byte objects are created
+        self.values = None
+        if num_records == 0:
+            self.data = bytearray(CAPACITY)
+            self.values = memoryview(self.data).cast('q')
+
+    def is_loaded(self):
+        return self.values is not None
+
+    """
+    # read the page's contents from its page file
+    """
+    def load(self):
+        self.data = self.page_file.read_page(self.page_number)
+        self.values = memoryview(self.data).cast('q')
+
+    """
+    # drop the page's contents from memory, it is read again from the page file on the next load
+    """
+    def unload(self):
+        self.values.release()
+        self.values = None
+        self.data = None
+
+    """
+    # write the page back to its page file if it has changed since it was last written
+    """
+    def flush(self):
+        if self.dirty and self.page_file is not None:
+            self.dirty = False # cleared first, a change made while the page is being written marks it dirty again
+            self.page_file.write_page(self.page_number, self.data)
+
+    def has_capacity(self):
+        return self.num_records < RECORDS_PER_PAGE
 
+    """
+    # append a value to the next free slot of the page
+    # returns False if the page is full
+    """
     def write(self, value):
-        if self.has_capacity(ENTRY_SIZE):
-            # if none write 0 
+        if self.has_capacity():
+            # if none write 0
             if value is None:
                 value = 0
-            
-            if isinstance(value, str):
-                value_bytes = value.encode()
-                value_bytes = value_bytes[:ENTRY_SIZE].ljust(ENTRY_SIZE, b'0')
-                self.data[self.page_size:self.page_size + ENTRY_SIZE] = value_bytes
-                self.page_size += ENTRY_SIZE
-            elif isinstance(value, float):
-                value_bytes = struct.pack('<d', value)
-                self.data[self.page_size:self.page_size + ENTRY_SIZE] = value_bytes
-                self.page_size += ENTRY_SIZE
-            else:
-                self.data[self.page_size:self.page_size + ENTRY_SIZE] = value.to_bytes(ENTRY_SIZE, byteorder="little")
-                self.page_size += ENTRY_SIZE
+            self.values[self.num_records] = value
+            self.num_records += 1
+            self.dirty = True
             return True
         return False
-    
-    def read(self, lower_index):
-        upper_index = lower_index + ENTRY_SIZE
-        # this should always pass since we don't write unless we have the full capacity needed, but just in case
-        if upper_index < CAPACITY:
-            return(self.data[lower_index:upper_index])
-        else:
-            return None
-        
+
+    """
+    # returns the integer stored in the given slot
+    """
+    def get(self, slot):
+        return self.values[slot]
+
+    """
+    # bulk read, returns the integers stored in the given slots in the same order
+    """
+    def get_many(self, slots):
+        values = self.values
+        return [values[slot] for slot in slots]
+
     """
     # replace the value of an entry already within the page. mostly just for indirection pointers
+    # slot - the slot of the entry that will be replaced
     # value - the new value of the entry (as an integer)
-    # index - the index of the entry that will be replaced
     """
-    def replace(self, value, index):
-
-        if isinstance(value, int):
-            value_bytes = value.to_bytes(ENTRY_SIZE, byteorder="little")
-        elif isinstance(value, str):
-            value_bytes = value.encode()
-            value_bytes = value_bytes[:ENTRY_SIZE].ljust(ENTRY_SIZE, b'0')
-        else:
-            value_bytes = value  # assume it's already bytes
-        
-        self.data[index:index+ENTRY_SIZE] = value_bytes
+    def set(self, slot, value):
+        self.values[slot] = value
+        self.dirty = True
 
         
 class PageRange:
 
-    def __init__(self, num_columns): # initialize 16 base pages indexed at 0
-        self.num_columns = num_columns # this includes the 4 metadata columns when we pass it in from table. page range doesn't need to be concerned about this
-        self.basePageToWrite = 0 # a variable that keeps count of the current base page we should write to, I feel like this implementation might need to be revisited when deletion comes along - DH
-
-        self.base_pages = []
-        for base_page in range(MAX_BASE_PAGES): # make 16 base pages
-            self.base_pages.append([])
-            for page in range(0, (self.num_columns)): 
-                self.base_pages[base_page].append(Page()) # create a page for each column
+    """
+    # num_columns: includes the 4 metadata columns when we pass it in from table. page range doesn't need to be concerned about this
+    # allocate_page: called with a column index, returns a new empty Page for that column (the table decides where pages live on disk)
+    # tail values pages are allocated as column num_columns
+    # bufferpool: pages are pinned through it while records are written into them
+    """
+    def __init__(self, num_columns, allocate_page, bufferpool):
+        self.num_columns = num_columns
+        self.allocate_page = allocate_page
+        self.bufferpool = bufferpool
 
+        # pages are allocated on first write, so an empty page range only costs these two lists
+        self.base_pages = [None] * MAX_BASE_PAGES # base_pages[i] becomes a list with a page for each column once a record lands in it
+        # tail records are sparse: tail_pages[i] only has a page for each of the MANDATORY_COLUMNS metadata columns, aligned like the base pages,
+        # and the values of the data columns a tail record holds are appended to tail_value_pages, one after the other
         self.tail_pages = []
-        self.allocate_new_tail_page()
+        self.tail_value_pages = []
+
+        # accounting so the table can report how much memory its page ranges actually use
+        self.allocated_pages = 0
+        self.num_base_records = 0
+        self.num_tail_records = 0
+        self.num_tail_values = 0
+
+        # merge bookkeeping: tps is the newest tail RID whose values the base pages already hold (0 until the first merge)
+        # and merged_tail_records how many of the range's tail records that covers
+        self.tps = 0
+        self.merged_tail_records = 0
+        # offsets of tail records written by transactions that haven't committed or aborted yet, only kept in memory
+        self.uncommitted = set()
+        # base RIDs of records deleted by transactions that haven't committed or aborted yet, an abort walks their chains again
+        self.uncommitted_deletes = set()
+
+    """
+    # number of bytes taken up by written entries, as opposed to allocated_pages * CAPACITY which is what the pages reserve
+    """
+    @property
+    def bytes_in_use(self):
+        return (self.num_base_records * self.num_columns + self.num_tail_records * MANDATORY_COLUMNS + self.num_tail_values) * ENTRY_SIZE
+
+    def allocate_new_base_page(self, page_index):
+        self.base_pages[page_index] = [self.allocate_page(column) for column in range(self.num_columns)] # create a page for each column
+        self.allocated_pages += self.num_columns
 
     def allocate_new_tail_page(self):
         newTailPage = []
-        for page in range(self.num_columns): # create one tail page
-            newTailPage.append(Page())
+        for column in range(MANDATORY_COLUMNS): # create one tail page
+            newTailPage.append(self.allocate_page(column))
         self.tail_pages.append(newTailPage)
+        self.allocated_pages += MANDATORY_COLUMNS
+
+    def allocate_new_tail_value_page(self):
+        self.tail_value_pages.append(self.allocate_page(self.num_columns))
+        self.allocated_pages += 1
+
+    """
+    # every page of the range, base pages first
+    """
+    def pages(self):
+        for base_page in self.base_pages:
+            if base_page is not None:
+                yield from base_page
+        for tail_page in self.tail_pages:
+            yield from tail_page
+        yield from self.tail_value_pages
+
+    """
+    # describes the range for the table's metadata file. pages are stored as [page_number, num_records] pairs, one per column
+    """
+    def get_metadata(self):
+        def describe(pages):
+            return [[page.page_number, page.num_records] for page in pages]
+        return {
+            'base_pages': [None if base_page is None else describe(base_page) for base_page in self.base_pages],
+            'tail_pages': [describe(tail_page) for tail_page in self.tail_pages],
+            'tail_value_pages': describe(self.tail_value_pages),
+            'num_base_records': self.num_base_records,
+            'num_tail_records': self.num_tail_records,
+            'num_tail_values': self.num_tail_values,
+            'tps': self.tps,
+            'merged_tail_records': self.merged_tail_records,
+        }
 
-    def insert_to_tail_page(self):
-        #reminder to possibly implement if we decide to do so
-        pass
+    """
+    # rebuilds the range from get_metadata's output. pages are only read from page_files (one per column) when first touched
+    """
+    def load_metadata(self, metadata, page_files):
+        def restore(pages):
+            self.allocated_pages += len(pages)
+            return [Page(page_number, page_files[column], num_records) for column, (page_number, num_records) in enumerate(pages)]
+        self.base_pages = [None if base_page is None else restore(base_page) for base_page in metadata['base_pages']]
+        self.tail_pages = [restore(tail_page) for tail_page in metadata['tail_pages']]
+        self.tail_value_pages = [Page(page_number, page_files[self.num_columns], num_records) for page_number, num_records in metadata['tail_value_pages']]
+        self.allocated_pages += len(self.tail_value_pages)
+        self.num_base_records = metadata['num_base_records']
+        self.num_tail_records = metadata['num_tail_records']
+        self.num_tail_values = metadata['num_tail_values']
+        self.tps = metadata['tps']
+        self.merged_tail_records = metadata['merged_tail_records']
+
+    """
+    # write a full base record (metadata + data columns) into the given base page
+    # the record is aligned across the columns, so it lands in the same slot of every column's page
+    """
+    def insert_to_base_page(self, page_index, values):
+        if self.base_pages[page_index] is None:
+            self.allocate_new_base_page(page_index)
+        base_page = self.base_pages[page_index]
+        self.bufferpool.pin_all(base_page)
+        for i in range(self.num_columns):
+            base_page[i].write(values[i])
+        self.bufferpool.unpin_all(base_page)
+        self.num_base_records += 1
+
+    """
+    # append a tail record to the last tail page, allocating a new tail page if it is full
+    # values: the record's metadata columns, tail_values: what it keeps of its data columns (the table decides the layout)
+    # returns the offset of the record among this page range's tail records (tail page index * RECORDS_PER_PAGE + slot)
+    # and the position of its first tail value
+    """
+    def insert_to_tail_page(self, values, tail_values):
+        offset = self.num_tail_records
+        if offset == len(self.tail_pages) * RECORDS_PER_PAGE:
+            self.allocate_new_tail_page()
+        tail_page = self.tail_pages[-1]
+        self.bufferpool.pin_all(tail_page)
+        for i in range(MANDATORY_COLUMNS):
+            tail_page[i].write(values[i]) # None values are written as 0
+        self.bufferpool.unpin_all(tail_page)
+        self.num_tail_records += 1
+        position = self.num_tail_values
+        self.write_tail_values(position, tail_values)
+        return offset, position
+
+    """
+    # sets the tail values from position on, allocating tail value pages up to the last one. a record's values can span two pages
+    """
+    def write_tail_values(self, position, tail_values):
+        while len(self.tail_value_pages) * RECORDS_PER_PAGE < position + len(tail_values):
+            self.allocate_new_tail_value_page()
+        for value in tail_values:
+            page = self.tail_value_pages[position // RECORDS_PER_PAGE]
+            slot = position % RECORDS_PER_PAGE
+            self.bufferpool.pin(page)
+            page.set(slot, value)
+            page.num_records = max(page.num_records, slot + 1)
+            self.bufferpool.unpin(page)
+            position += 1
+        self.num_tail_values = max(self.num_tail_values, position)
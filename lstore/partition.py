@@ -0,0 +1,361 @@
+from lstore.db import Database
+from lstore.query import Query, KEY_QUERIES, SELECT_QUERIES, SUM_QUERIES
+from lstore.transaction import Transaction
+from lstore.bufferpool import DEFAULT_FRAMES
+from lstore.db import CHECKPOINT_INTERVAL
+from lstore.index import BTREE_INDEX
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+
+PARTITION_DIRECTORY = 'partition_%d' # directory of each partition's database, in the directory the database is opened in
+PARTITIONS_FILE = 'partitions.json' # the number of partitions the keys of a database are spread over, fixed once it is created
+
+"""
+# The loop of a partition's process. The partition is an ordinary Database holding the records of its keys,
+# the process answers one request from the coordinator at a time over conn:
+# ('create_table', name, num_columns, key, cumulative)  ('drop_table', name)          ('tables',)
+# ('create_index', name, column, type)                  ('drop_index', name, column, type)
+# ('query', table, method, args)                        a query outside of a transaction
+# ('run', queries, optimistic)                          a transaction that only touches this partition
+# ('prepare', id, queries, optimistic)                  this partition's part of a transaction that spans several
+# ('commit', id) ('abort', id)                          the decision for a prepared part
+# ('close',)
+# queries are (table, method, args, partial): a partial query is part of a broadcast query, it doesn't fail when the
+# partition has no matching records, the coordinator decides that once it has every partition's result
+"""
+def serve_partition(conn, path, bufferpool_frames, checkpoint_interval):
+    db = Database(bufferpool_frames, checkpoint_interval)
+    if path is not None:
+        db.open(path)
+    queries = {name: Query(table) for name, table in db.tables.items()}
+    prepared = {} # coordinator's transaction id -> transaction waiting for the decision
+    while True:
+        request = conn.recv()
+        operation = request[0]
+        try:
+            if operation == 'create_table':
+                name, num_columns, key, cumulative = request[1:]
+                queries[name] = Query(db.create_table(name, num_columns, key, cumulative))
+                reply = True
+            elif operation == 'drop_table':
+                queries.pop(request[1], None)
+                reply = db.drop_table(request[1])
+            elif operation == 'tables':
+                reply = [(table.name, table.num_columns, table.key) for table in db.tables.values()]
+            elif operation == 'create_index':
+                name, column, index_type = request[1:]
+                reply = db.get_table(name).index.create_index(column, index_type)
+            elif operation == 'drop_index':
+                name, column, index_type = request[1:]
+                reply = db.get_table(name).index.drop_index(column, index_type)
+            elif operation == 'query':
+                name, method, args = request[1:]
+                reply = getattr(queries[name], method)(*args)
+            elif operation == 'run':
+                transaction, results = partition_transaction(queries, request[1])
+                committed = transaction.prepare(request[2]) and transaction.commit()
+                reply = (committed, transaction.conflict, results)
+            elif operation == 'prepare':
+                transaction_id, transaction_queries, optimistic = request[1:]
+                transaction, results = partition_transaction(queries, transaction_queries)
+                ready = transaction.prepare(optimistic)
+                if ready:
+                    prepared[transaction_id] = transaction
+                reply = (ready, transaction.conflict, results)
+            elif operation == 'commit':
+                reply = prepared.pop(request[1]).commit()
+            elif operation == 'abort':
+                reply = prepared.pop(request[1]).abort()
+            elif operation == 'close':
+                for transaction in prepared.values():
+                    transaction.abort()
+                db.close()
+                conn.send(True)
+                return
+        except Exception as e:
+            reply = e
+        conn.send(reply)
+
+"""
+# builds this partition's transaction for the given queries. returns it with the list the results of its
+# partial queries are added to, in order
+"""
+def partition_transaction(queries, transaction_queries):
+    transaction = Transaction()
+    results = []
+    for name, method, args, partial in transaction_queries:
+        query = getattr(queries[name], method)
+        if partial:
+            query = partial_query(query, results)
+        transaction.add_query(query, None, *args)
+    return transaction, results
+
+# wraps a query so it only fails the transaction when it couldn't get its locks
+def partial_query(query, results):
+    def run(*args, transaction=None):
+        result = query(*args, transaction=transaction)
+        results.append(result)
+        return not (result is False and transaction.conflict)
+    return run
+
+
+class PartitionedDatabase:
+
+    """
+    # A database whose tables are hash partitioned by primary key over num_partitions processes, so transactions
+    # on different partitions run on different cores instead of taking turns on the GIL
+    # each partition is a forked process with an ordinary Database holding its share of every table. this process is
+    # the coordinator: it sends a transaction that only touches one partition to that partition to run, and runs a
+    # transaction that spans several with two phase commit. every partition prepares its part (runs its queries and
+    # keeps its locks), and only if all of them are ready are the parts committed, otherwise the ready ones abort
+    # prepared parts are not logged, a partition that crashes before its commit rolls its part back on recovery. the
+    # decision isn't logged either: a coordinator that crashes while it sends out the commits leaves the transaction
+    # committed in the partitions that got theirs and rolled back in the others
+    # a key's partition depends on the number of partitions, so a database directory keeps the number it was created
+    # with and every later open uses it
+    # the API matches Database, PartitionedQuery replaces Query and transactions run on TransactionWorkers as usual
+    """
+    def __init__(self, num_partitions=None, bufferpool_frames=DEFAULT_FRAMES, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.requested_partitions = num_partitions # None leaves the number to the database directory, or the number of cores
+        self.num_partitions = num_partitions if num_partitions is not None else os.cpu_count()
+        self.bufferpool_frames = bufferpool_frames # of each partition
+        self.checkpoint_interval = checkpoint_interval
+        self.tables = {}
+        self.path = None
+        self.processes = []
+        self.connections = []
+        self.latches = [] # one per partition, held for a request and its reply
+        self.transaction_ids = itertools.count(1)
+
+    """
+    # starts the partition processes. path is the directory of the database, each partition keeps its records
+    # in a directory of its own in it. None keeps the partitions in memory
+    """
+    def start(self, path=None):
+        context = multiprocessing.get_context('fork')
+        for i in range(self.num_partitions):
+            partition_path = os.path.join(path, PARTITION_DIRECTORY % i) if path is not None else None
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=serve_partition, args=(child_conn, partition_path, self.bufferpool_frames, self.checkpoint_interval), daemon=True)
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.connections.append(conn)
+            self.latches.append(threading.Lock())
+        for name, num_columns, key in self.call(0, ('tables',)):
+            self.tables[name] = PartitionedTable(self, name, num_columns, key)
+
+    """
+    # Opens the database stored in the directory at path, creating it if it doesn't exist
+    # raises ValueError if the database was created with another number of partitions than the one asked for
+    """
+    def open(self, path):
+        os.makedirs(path, exist_ok=True)
+        partitions_file = os.path.join(path, PARTITIONS_FILE)
+        if os.path.exists(partitions_file):
+            with open(partitions_file) as f:
+                num_partitions = json.load(f)['num_partitions']
+            if self.requested_partitions is not None and self.requested_partitions != num_partitions:
+                raise ValueError(f"the database at '{path}' has {num_partitions} partitions, not {self.requested_partitions}")
+            self.num_partitions = num_partitions
+        else:
+            with open(partitions_file + '.tmp', 'w') as f:
+                json.dump({'num_partitions': self.num_partitions}, f)
+            os.replace(partitions_file + '.tmp', partitions_file)
+        self.path = path
+        self.start(path)
+
+    def close(self):
+        self.call_all(range(len(self.connections)), ('close',))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.connections = []
+        self.latches = []
+        self.tables = {}
+
+    def create_table(self, name, num_columns, key_index, cumulative=False):
+        if not self.processes:
+            self.start()
+        if name in self.tables:
+            print(f"dupe table name: '{name}' already exists")
+            return None
+        self.call_all(range(self.num_partitions), ('create_table', name, num_columns, key_index, cumulative))
+        self.tables[name] = PartitionedTable(self, name, num_columns, key_index)
+        return self.tables[name]
+
+    def drop_table(self, name):
+        if name not in self.tables:
+            print(f"table '{name}' DNE")
+            return False
+        del self.tables[name]
+        self.call_all(range(self.num_partitions), ('drop_table', name))
+        return True
+
+    def get_table(self, name):
+        return self.tables.get(name, None)
+
+    # the partition that owns the record with the given primary key
+    def partition(self, key):
+        return hash(key) % self.num_partitions
+
+    # sends a request to a partition and returns its reply
+    def call(self, partition, request):
+        return self.call_all([partition], request)[0]
+
+    """
+    # sends request to each of the given partitions and returns their replies in the same order. every request
+    # goes out before the first reply is awaited, so the partitions work on them at the same time
+    # request can be a function of the partition instead. the latches are taken in partition order so two
+    # threads calling the same partitions can't wait on each other
+    """
+    def call_all(self, partitions, request):
+        partitions = sorted(partitions)
+        latches = [self.latches[partition] for partition in partitions]
+        for latch in latches:
+            latch.acquire()
+        try:
+            for partition in partitions:
+                self.connections[partition].send(request(partition) if callable(request) else request)
+            replies = [self.connections[partition].recv() for partition in partitions]
+        finally:
+            for latch in latches:
+                latch.release()
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    """
+    # runs transaction in the partitions that own its records, returns True if it committed. a transaction that
+    # lost a lock in any partition is aborted everywhere with conflict set, so its worker tries it again
+    """
+    def run(self, transaction, optimistic=False):
+        transaction.conflict = False
+        parts = {} # partition -> (table, method, args, partial) of its queries
+        broadcasts = 0 # queries sent to every partition so far, each partition lists their results in this order
+        sums = [] # positions of the broadcast sums among them
+        for query, args in transaction.queries:
+            owner = query.__self__
+            partitions = owner.route(query.__name__, args)
+            partial = len(partitions) > 1
+            if partial:
+                if query.__name__ in SUM_QUERIES:
+                    sums.append(broadcasts)
+                broadcasts += 1
+            for partition in partitions:
+                parts.setdefault(partition, []).append((owner.table.name, query.__name__, args, partial))
+
+        if len(parts) == 1:
+            (partition, queries), = parts.items()
+            committed, conflict, results = self.call(partition, ('run', queries, optimistic))
+            transaction.conflict = conflict
+            return committed
+
+        transaction_id = next(self.transaction_ids)
+        partitions = sorted(parts)
+        votes = self.call_all(partitions, lambda partition: ('prepare', transaction_id, parts[partition], optimistic))
+        ready = [partitions[i] for i in range(len(partitions)) if votes[i][0]]
+        commit = len(ready) == len(partitions)
+        # a sum fails if none of the partitions found a record in its range
+        for position in sums:
+            if commit and all(vote[2][position] is False for vote in votes):
+                commit = False
+        if ready:
+            self.call_all(ready, ('commit' if commit else 'abort', transaction_id))
+        transaction.conflict = any(vote[1] for vote in votes)
+        return commit
+
+
+class PartitionedTable:
+
+    """
+    # stands for a table of a PartitionedDatabase, whose records live in the partitions
+    """
+    def __init__(self, database, name, num_columns, key):
+        self.database = database
+        self.name = name
+        self.num_columns = num_columns
+        self.key = key
+        self.index = PartitionedIndex(self)
+
+
+class PartitionedIndex:
+
+    """
+    # creates and drops an index of a partitioned table in every partition
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def create_index(self, column_number, index_type=BTREE_INDEX):
+        database = self.table.database
+        database.call_all(range(database.num_partitions), ('create_index', self.table.name, column_number, index_type))
+
+    def drop_index(self, column_number, index_type=None):
+        database = self.table.database
+        database.call_all(range(database.num_partitions), ('drop_index', self.table.name, column_number, index_type))
+
+
+class PartitionedQuery:
+
+    """
+    # Query for a table of a PartitionedDatabase. queries outside of a transaction are sent to the partitions they
+    # need right away, in a transaction they are routed by PartitionedDatabase.run
+    """
+    partitioned = True
+
+    def __init__(self, table):
+        self.table = table
+        self.database = table.database
+
+    """
+    # the partitions a query with the given method and arguments has to run in
+    """
+    def route(self, method, args):
+        if method == 'insert':
+            return [self.database.partition(args[self.table.key])]
+        if method in KEY_QUERIES or (method in SELECT_QUERIES and args[1] == self.table.key):
+            return [self.database.partition(args[0])]
+        return list(range(self.database.num_partitions))
+
+    # runs the query in its partitions and combines their results
+    def call(self, method, args):
+        partitions = self.route(method, args)
+        results = self.database.call_all(partitions, ('query', self.table.name, method, args))
+        if len(partitions) == 1:
+            return results[0]
+        if method in SUM_QUERIES:
+            sums = [result for result in results if result is not False]
+            return sum(sums) if sums else False
+        # a select through another column gathers the matching records of every partition
+        if any(result is False for result in results):
+            return False
+        return [record for result in results for record in result]
+
+    def delete(self, primary_key):
+        return self.call('delete', (primary_key,))
+
+    def insert(self, *columns):
+        return self.call('insert', columns)
+
+    def select(self, search_key, search_key_index, projected_columns_index):
+        return self.call('select', (search_key, search_key_index, projected_columns_index))
+
+    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
+        return self.call('select_version', (search_key, search_key_index, projected_columns_index, relative_version))
+
+    def update(self, primary_key, *columns):
+        return self.call('update', (primary_key, *columns))
+
+    def sum(self, start_range, end_range, aggregate_column_index):
+        return self.call('sum', (start_range, end_range, aggregate_column_index))
+
+    def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
+        return self.call('sum_version', (start_range, end_range, aggregate_column_index, relative_version))
+
+    def increment(self, key, column):
+        return self.call('increment', (key, column))
@@ -1,8 +1,16 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.lock_manager import SHARED, EXCLUSIVE, INCREMENT
 
 LATEST_VERSION = 0
 
+# queries that name the record they touch by its primary key, as their first argument (insert: in the key column)
+KEY_QUERIES = ('insert', 'update', 'delete', 'increment')
+# queries that search a column, by primary key they only read one record
+SELECT_QUERIES = ('select', 'select_version')
+# queries over a range of primary keys
+SUM_QUERIES = ('sum', 'sum_version')
+
 class Query:
     """
     # Creates a Query object that can perform different queries on the specified table 
@@ -14,6 +22,32 @@ class Query:
         self.table = table
         pass
 
+    """
+    # takes a record lock for the transaction running the query. queries run outside of a transaction don't lock
+    # returns False if another transaction holds a conflicting lock
+    """
+    def lock(self, key, mode, transaction):
+        if transaction is None:
+            return True
+        return transaction.lock(self.table, key, mode)
+
+    # read timestamp of the transaction if it reads from a snapshot, None if it reads under locks
+    def snapshot(self, transaction):
+        if transaction is None:
+            return None
+        return transaction.read_timestamp
+
+    # True while the transaction runs optimistically: its reads go through the transaction and its writes are buffered
+    def optimistic(self, transaction):
+        return transaction is not None and transaction.optimistic
+
+    # locks the records with the given base RIDs by their primary keys
+    def lock_records(self, RIDs, mode, transaction):
+        for key in self.table.get_column_values(RIDs, self.table.key):
+            if not self.lock(key, mode, transaction):
+                return False
+        return True
+
     
     """
     # internal Method
@@ -21,7 +55,7 @@ class Query:
     # Returns True upon succesful deletion
     # Return False if record doesn't exist or is locked due to 2PL
     """
-    def delete(self, primary_key):
+    def delete(self, primary_key, transaction=None):
         # #read a record
         # #use index to locate rid
         # rid = self.table.index.locate( self.table.key, primary_key)
@@ -41,7 +75,14 @@ class Query:
         # #if locked
         # except: 
         #     return False
-        self.table.delete_record(primary_key)
+        if self.optimistic(transaction):
+            if transaction.read_key(self.table, primary_key) is None:
+                return False
+            transaction.buffer(self.table, primary_key, None, self.delete, (primary_key,))
+            return True
+        if not self.lock(primary_key, EXCLUSIVE, transaction):
+            return False
+        return self.table.delete_record(primary_key, transaction)
     
     
     """
@@ -49,11 +90,19 @@ class Query:
     # Return True upon succesful insertion
     # Returns False if insert fails for whatever reason
     """
-    def insert(self, *columns):
+    def insert(self, *columns, transaction=None):
         # #variables
         # schema_encoding = '0' * self.table.num_columns
         # primary_key = columns[self.table.key]
         # rid = len(self.table.page_directory)
+        if self.optimistic(transaction):
+            if transaction.read_key(self.table, columns[self.table.key]) is not None:
+                return False
+            transaction.buffer(self.table, columns[self.table.key], list(columns), self.insert, columns)
+            return True
+        # the key is locked before the duplicate check, so a concurrent insert of the same key can't slip in between
+        if not self.lock(columns[self.table.key], EXCLUSIVE, transaction):
+            return False
         RIDs = self.table.index.locate(self.table.key, columns[self.table.key]) 
         if len(RIDs) >= 1:
              return False
@@ -68,7 +117,7 @@ class Query:
         
         # except:
         #     return False  
-        return self.table.insert_new_record(columns)     
+        return self.table.insert_new_record(columns, transaction)     
         
         
 
@@ -81,30 +130,14 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
-    def select(self, search_key, search_key_index, projected_columns_index):
+    def select(self, search_key, search_key_index, projected_columns_index, transaction=None):
         #introduce some sort of rab bit hunting through the tail records, 
             # as well as checking what values we have gathered already
         #rid key map
         # get one RID
         # get RID of base record, then access indirection and get tail record, 
             #  get specified column data we want
-        rids = self.table.index.locate(search_key_index, search_key)
-        
-        #no needed since select wont call key that DNE
-        #if len(rids) == 0:
-        #    return False
-        
-        rid = rids[0]
-        return_columns = []
-        
-        for i in range(len(projected_columns_index)):
-            if projected_columns_index[i] == 1:
-                return_columns.append(self.table.rabbit_hunt(i, search_key, LATEST_VERSION))
-            #dont need
-            #else:
-                #return_columns.append(0)
-        #return a list!! of Record ojs
-        return [Record(rid, search_key, return_columns)]
+        return self.select_version(search_key, search_key_index, projected_columns_index, LATEST_VERSION, transaction=transaction)
     
 
 
@@ -118,30 +151,58 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
-    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
+    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version, transaction=None):
         #introduce some sort of rab bit hunting through the tail records, 
             # as well as checking what values we have gathered already
         #rid key map
         # get one RID
         # get RID of base record, then access indirection and get tail record, 
             # get specified column data we want
-        rids = self.table.index.locate(search_key_index, search_key)
+        if self.optimistic(transaction):
+            return self.select_optimistic(search_key, search_key_index, projected_columns_index, relative_version, transaction)
+        snapshot = self.snapshot(transaction)
+        if snapshot is not None:
+            # snapshot reads take no locks. they find records through the indexes, which hold the latest values,
+            # and the records written or deleted since the snapshot started, by their values at the snapshot
+            rids = self.table.visible_RIDs(self.table.index.locate(search_key_index, search_key), snapshot, search_key_index, search_key, search_key)
+        else:
+            if search_key_index == self.table.key and not self.lock(search_key, SHARED, transaction):
+                return False
+            rids = self.table.index.locate(search_key_index, search_key)
+            # records found through another column are locked by their primary key once they are found
+            if search_key_index != self.table.key and transaction is not None and not self.lock_records(rids, SHARED, transaction):
+                return False
         
         #not needed since select will never call key that DNE
         #if len(rids) == 0:
         #    return False
         
-        rid = rids[0]
-        return_columns = []
-        
-        for i in range(len(projected_columns_index)):
-            if projected_columns_index[i] == 1:
-                return_columns.append(self.table.rabbit_hunt(i, search_key, relative_version))
-            #can leave out to not add zeros to output
-            #else:
-                #return_columns.append(0)
+        # each record is rebuilt with a single walk down its version chain
+        records = []
+        for rid in rids:
+            return_columns = self.table.get_record(rid, projected_columns_index, relative_version, snapshot)
+            records.append(Record(rid, search_key, return_columns))
         #return a list of Record ojs
-        return [Record(rid, search_key, return_columns)]
+        return records
+
+    """
+    # select for an optimistic transaction, without locks. the transaction notes the version of every record read and
+    # answers for the records it has written itself, a record it inserted is only found by its primary key
+    """
+    def select_optimistic(self, search_key, search_key_index, projected_columns_index, relative_version, transaction):
+        if search_key_index == self.table.key and (self.table, search_key) in transaction.written:
+            columns = transaction.written[(self.table, search_key)]
+            if columns is None:
+                return []
+            return [Record(None, search_key, [columns[i] for i in range(self.table.num_columns) if projected_columns_index[i] == 1])]
+        records = []
+        rids = self.table.index.locate(search_key_index, search_key)
+        transaction.scan(self.table, search_key_index, search_key, search_key, rids)
+        for rid in rids:
+            return_columns = transaction.read(self.table, rid, projected_columns_index, relative_version)
+            if return_columns is not None:
+                records.append(Record(rid, search_key, return_columns))
+        return records
 
 #############
 
@@ -152,7 +213,7 @@ class Query:
     # Returns True if update is succesful
     # Returns False if no records exist with given key or if the target record cannot be accessed due to 2PL locking
     """
-    def update(self, primary_key, *columns):
+    def update(self, primary_key, *columns, transaction=None):
         # # locating our record using the primary key, index to locate faster
         # rid = self.table.index.locate(self.table.key, primary_key)
 
@@ -183,7 +244,16 @@ class Query:
         #     return False
         # pass
 
-        return self.table.update_record(primary_key, columns)
+        if self.optimistic(transaction):
+            record = transaction.read_key(self.table, primary_key)
+            if record is None:
+                return False
+            record = [record[i] if i >= len(columns) or columns[i] is None else columns[i] for i in range(self.table.num_columns)]
+            transaction.buffer(self.table, primary_key, record, self.update, (primary_key, *columns))
+            return True
+        if not self.lock(primary_key, EXCLUSIVE, transaction):
+            return False
+        return self.table.update_record(primary_key, columns, transaction)
 
     
     """
@@ -194,26 +264,8 @@ class Query:
     # Returns the summation of the given range upon success
     # Returns False if no record exists in the given range
     """
-    def sum(self, start_range, end_range, aggregate_column_index):
-        total = 0   # starting at 0 count
-        found = False   # making sure there is at least 1 valid record found
-
-        try:
-            # going through all of the keys in range
-            for key in range(start_range, end_range + 1):
-
-                # adding values from the most recent versions
-                to_add = self.table.rabbit_hunt(aggregate_column_index, key, LATEST_VERSION)
-                if to_add is not None:
-                    total += to_add
-                found = True
-
-            # return false if no records are found
-            return total if found else False
-        except:
-            return False
-
-        pass
+    def sum(self, start_range, end_range, aggregate_column_index, transaction=None):
+        return self.sum_version(start_range, end_range, aggregate_column_index, LATEST_VERSION, transaction=transaction)
 
     
     """
@@ -225,27 +277,45 @@ class Query:
     # Returns the summation of the given range upon success
     # Returns False if no record exists in the given range
     """
-    def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
-        # no versions will exist if page_directory stores only 1 tuple per RID
-
-        total = 0   # starting at 0 count
-        found = False   # making sure there is at least 1 valid record found
-
+    def sum_version(self, start_range, end_range, aggregate_column_index, relative_version, transaction=None):
         try:
-            # going through all of the keys in range
-            for key in range(start_range, end_range + 1):
-
-                # adding values from the most recent versions
+            # only the keys that exist in the range are visited, not every integer between start and end
+            rids = self.table.index.locate_range(start_range, end_range, self.table.key)
+            if self.optimistic(transaction):
+                return self.sum_optimistic(start_range, end_range, aggregate_column_index, relative_version, rids, transaction)
+            snapshot = self.snapshot(transaction)
+            if snapshot is not None:
+                rids = self.table.visible_RIDs(rids, snapshot, self.table.key, start_range, end_range)
 
-                to_add = self.table.rabbit_hunt(aggregate_column_index, key, relative_version)
-                if to_add is not None:
-                    total += to_add
-                found = True
             # return false if no records are found
-            return total if found else False
+            if len(rids) == 0:
+                return False
+            if snapshot is None and transaction is not None and not self.lock_records(rids, SHARED, transaction):
+                return False
+
+            # values are resolved a base page at a time
+            return sum(self.table.get_column_values(rids, aggregate_column_index, relative_version, snapshot))
         except:
             return False
 
+    # sum for an optimistic transaction: every record is read through the transaction, and the records it inserted count too
+    def sum_optimistic(self, start_range, end_range, aggregate_column_index, relative_version, rids, transaction):
+        transaction.scan(self.table, self.table.key, start_range, end_range, rids)
+        projected_columns_index = [0] * self.table.num_columns
+        projected_columns_index[aggregate_column_index] = 1
+        values = []
+        for rid in rids:
+            columns = transaction.read(self.table, rid, projected_columns_index, relative_version)
+            if columns is not None:
+                values.append(columns[0])
+        for (table, key), columns in transaction.written.items():
+            # records that didn't exist when the transaction looked for them
+            if table is self.table and start_range <= key <= end_range and columns is not None and transaction.read_set[(table, key)][0] is None:
+                values.append(columns[aggregate_column_index])
+        if len(values) == 0:
+            return False
+        return sum(values)
+
 
     
     """
@@ -256,15 +326,16 @@ class Query:
     # Returns True is increment is successful
     # Returns False if no record matches key or if target record is locked by 2PL.
     """
-    def increment(self, key, column):
-        r = self.select(key, self.table.key, [1] * self.table.num_columns)[0]
-        if r is not False:
-            # creating an update list
+    def increment(self, key, column, transaction=None):
+        if self.optimistic(transaction):
+            record = transaction.read_key(self.table, key)
+            if record is None:
+                return False
             updated_columns = [None] * self.table.num_columns
-
-            # incrementing the specific column
-            updated_columns[column] = r[column] + 1
-
-            # returning and applying the updated columns
-            return self.update(key, *updated_columns)
-        return False
+            updated_columns[column] = record[column] + 1
+            return self.update(key, *updated_columns, transaction=transaction)
+        # a delta tail record adds 1 without reading the record. increment locks don't conflict with each other,
+        # so transactions incrementing the same record don't abort each other
+        if not self.lock(key, INCREMENT, transaction):
+            return False
+        return self.table.increment_record(key, column, 1, transaction)
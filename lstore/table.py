@@ -1,7 +1,15 @@
 from lstore.index import Index
+import json
+import os
+import queue
+import threading
 import time
-import struct
-from lstore.page import Page, PageRange
+from array import array
+from lstore.page import Page, PageRange, CAPACITY, RECORDS_PER_PAGE
+from lstore.disk import PageFile
+from lstore.bufferpool import BufferPool
+from lstore.lock_manager import LockManager
+from lstore.wal import BASE_RECORD, TAIL_RECORD, SET_VALUE
 
 INDIRECTION_COLUMN = 0
 RID_COLUMN = 1
@@ -11,6 +19,46 @@ SCHEMA_ENCODING_COLUMN = 3
 MAX_BASE_PAGES = 16
 METADATA_COLUMNS = 4
 ENTRY_SIZE = 8 # 8 bytes
+RECORDS_PER_RANGE = MAX_BASE_PAGES * RECORDS_PER_PAGE # base records per page range
+
+TAIL_RID_START = 2 ** 62 # tail RIDs come from their own counter starting here so they never collide with base RIDs
+TAIL_OFFSET_MASK = (1 << 32) - 1 # low 32 bits of a tail directory entry hold the offset within the page range
+
+# timestamp of records written by a transaction that hasn't committed, newer than every snapshot. commit replaces it
+UNCOMMITTED_TIMESTAMP = 2 ** 63 - 1
+
+# set in the schema encoding of a delta tail record: its values are amounts added to the columns, not new values (see increment_record)
+DELTA_RECORD = 1 << 62
+# set in the schema encoding of a folded tail record: the sum of a column's deltas so far, so readers can stop there
+# it isn't an update of its own, older versions and snapshots skip it (its timestamp stays uncommitted)
+FOLDED_RECORD = 1 << 61
+# set in the schema encoding of a tail record of a cumulative table: besides the columns it updates (its schema bits) it holds
+# the latest value of every column updated before it, so the latest version of a record is complete at its newest such record
+CUMULATIVE_RECORD = 1 << 60
+# set, with DELTA_RECORD, in the schema encoding of a delta an abort appended to cancel one of its transaction's deltas (see undo_increment)
+COMPENSATION_RECORD = 1 << 59
+FOLD_INTERVAL = 8 # deltas appended to a column of a record before they are folded
+
+# read timestamps of the snapshot transactions running now. a snapshot registers while holding the commit latch (see
+# Transaction.prepare), so a delete that commits after a snapshot started always finds it here
+running_snapshots = set()
+snapshots_latch = threading.Lock()
+
+# the read timestamp of the oldest running snapshot, None if there is none
+def oldest_snapshot():
+    with snapshots_latch:
+        return min(running_snapshots) if running_snapshots else None
+
+METADATA_FILE = 'table.json'
+TAIL_DIRECTORY_FILE = 'tail_directory.bin'
+TAIL_VALUES_FILE = 'tail_values.pages' # page file of the tail values of every page range, see PageRange
+
+"""
+# a deleted record's RID column holds ~RID, which is negative for every RID (RID 0 included)
+# returns the RID a (possibly deleted) RID column value belongs to
+"""
+def deleted_RID(RID):
+    return RID if RID >= 0 else ~RID
 
 class Record:
 
@@ -35,19 +83,65 @@ class Table:
     :param name: string         #Table name
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key: int             #Index of table key in columns
+    :param path: string         #Directory the table is stored in, None keeps the table in memory only
+    :param bufferpool: BufferPool #Pool the table's pages are cached in, shared by all tables of a database
+    :param lock_manager: LockManager #Record locks taken by transactions, shared by all tables of a database
+    :param wal: WriteAheadLog   #Log every write is recorded in before it is made, None for tables kept in memory
+    :param cumulative: bool     #Whether updates write cumulative tail records, see CUMULATIVE_RECORD. kept with the table
     """
-    def __init__(self, name, num_columns, key):
+    def __init__(self, name, num_columns, key, path=None, bufferpool=None, lock_manager=None, wal=None, cumulative=False):
         self.name = name
         self.key = key
         self.num_columns = num_columns 
         self.total_columns = num_columns + METADATA_COLUMNS # + 4 for rid, indirection, schema, timestamping. these 4 columns are internal to table
-        self.page_directory = {} # key: column, RID --> value: page_range, page, page_offset
+        # base records are addressed arithmetically from their RID (see locate_record), so only tail records need a directory
+        # entry i holds the packed location (page_range << 32 | offset within the range's tail records) of tail RID tail_directory_start + i
+        # entries of tail records dropped by vacuum are -1, and vacuum cuts such entries off the front of the directory
+        self.tail_directory = array('q')
+        # tail records only keep the data columns they hold (see tail_values), this entry i holds where tail RID tail_directory_start + i's
+        # values start among its page range's tail values
+        self.tail_value_directory = array('q')
+        self.tail_directory_start = TAIL_RID_START
         self.page_ranges = []
+        self.merge_threshold_pages = 50  # The threshold to trigger a merge, in tail pages appended to a page range since its last merge
+        self.cumulative = cumulative # latest reads touch one tail record, for the space of carrying the updated columns along
+        self.delta_runs = {} # (base RID, column) -> (deltas since the column's last folded record, chain head, value there or None)
+        # base RID of a record written while snapshots run -> [commit timestamp of its latest committed write, writes not ended yet]
+        # the indexes hold the latest values and drop deleted records, snapshots that started before a write find the record
+        # here instead and check its value at the snapshot (see visible_RIDs)
+        self.changed = {}
+        self.merge_queue = queue.Queue() # page range indexes waiting for the merge thread
+        self.merges_pending = set()
+        self.merge_thread = None # started on the first merge
+        self.merge_lock = threading.RLock() # held for a whole merge, so vacuum and flush never see a merge half done
+        # guards page allocation and the base pages against the merge thread swapping them out
+        self.latch = threading.RLock()
+
+        self.RID_counter = 0 # counter for assigning base RIDs
+        self.tail_RID_counter = TAIL_RID_START # counter for assigning tail RIDs
         self.index = Index(self)
-        self.merge_threshold_pages = 50  # The threshold to trigger a merge
 
-        self.RID_counter = 0 # counter for assigning RIDs
-        self.page_ranges.append(PageRange(self.total_columns)) # create initial page range
+        # one page file per column, page numbers are handed out per column. the tail values are one more column, after the others
+        self.path = path
+        self.bufferpool = bufferpool if bufferpool is not None else BufferPool()
+        self.lock_manager = lock_manager if lock_manager is not None else LockManager()
+        self.wal = wal
+        self.checkpoint_lsn = 0 # the pages and metadata on disk reflect every logged write before this lsn
+        self.page_files = [None] * (self.total_columns + 1)
+        self.page_counts = [0] * (self.total_columns + 1)
+        # page numbers of released pages, handed out again before new ones. released pages are only retired at first:
+        # the last checkpoint may still describe them, so they become free once the next checkpoint is written
+        self.free_pages = [[] for column in range(self.total_columns + 1)]
+        self.retired_pages = [[] for column in range(self.total_columns + 1)]
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self.page_files = [PageFile(os.path.join(path, 'column_%d.pages' % column)) for column in range(self.total_columns)]
+            self.page_files.append(PageFile(os.path.join(path, TAIL_VALUES_FILE)))
+
+        if path is not None and os.path.exists(os.path.join(path, METADATA_FILE)):
+            self.load()
+        else:
+            self.page_ranges.append(PageRange(self.total_columns, self.allocate_page, self.bufferpool)) # create initial page range
 
 
         
@@ -55,222 +149,304 @@ class Table:
     # insert an entirely new record. this goes into a base page
     # columns: an array of the columns with values we want to insert. does not include the 4 metadata columns so we need to calculate those ourselves
     """
-    def insert_new_record(self, columns):
+    def insert_new_record(self, columns, transaction=None):
         
-        page_range = self.page_ranges[len(self.page_ranges)-1] # the page range we want to write to is the last one in the array
         # initialize an array with the complete list of data values to insert (metadata values + the record's values)
         values = [0] * METADATA_COLUMNS
         values[INDIRECTION_COLUMN] = 0 # not needed but included for clarity
-        values[RID_COLUMN] = self.getNewRID()
-        values[TIMESTAMP_COLUMN] = time.time()
-        values[SCHEMA_ENCODING_COLUMN] = '0' * self.num_columns
+        values[TIMESTAMP_COLUMN] = time.time_ns() if transaction is None else UNCOMMITTED_TIMESTAMP
+        values[SCHEMA_ENCODING_COLUMN] = 0 # bit i is set once column i has been updated
         values += columns
 
-        for i in range(self.total_columns):
-            # check if the base page fully has room for each column. if any of them don't, we need to move on to the next base page
-            if not page_range.base_pages[page_range.basePageToWrite][i].has_capacity(8): # len(values[i]) is future proofing lol -DH
-                page_range.basePageToWrite += 1 
-                break
-        # if the page range is full, then allocate a new page range
-        if page_range.basePageToWrite >= MAX_BASE_PAGES:
-            self.page_ranges.append(PageRange(self.total_columns))
-            page_range = self.page_ranges[len(self.page_ranges)-1]
-
-        # ---- THIS NEEDS TO BE REVISITED as all milestones have all columns as 64 bit integers, no strings or anything
-        # can safely write the entire base record into the base page of the selected page range
-        page_offsets = [None] * self.total_columns # save the page offsets for each column for later
-        for i in range(self.total_columns):
-            page_offsets[i] = page_range.base_pages[page_range.basePageToWrite][i].page_size
-            page_range.base_pages[page_range.basePageToWrite][i].write(values[i])
-        # ----------------------------------------------------------------------
-
+        # base RIDs are handed out in order, so the RID alone decides the page range, base page and slot
+        # the RID is taken under the latch too, records have to be appended in RID order
+        with self.latch:
+            values[RID_COLUMN] = self.getNewRID()
+            page_range_index, page_index, slot = self.locate_record(values[RID_COLUMN])
+            # if the page range is full, then allocate a new page range
+            if page_range_index == len(self.page_ranges):
+                self.page_ranges.append(PageRange(self.total_columns, self.allocate_page, self.bufferpool))
+            self.log(transaction, BASE_RECORD, values[RID_COLUMN], values)
+            self.page_ranges[page_range_index].insert_to_base_page(page_index, values)
 
         # add the values to the index. for now just index the primary key
         for i in range(self.num_columns):
             self.index.insert_record(values[RID_COLUMN], values[i + METADATA_COLUMNS], i)
 
-        # add the mapping to the page directory
-        page_range_index = len(self.page_ranges)-1
-        for i in range(self.total_columns):
-            # the page range index is always the same.
-            # the page is always the same since a record is aligned across the base page thus requiring them all to be written on the same page index in their columns
-            # use the page offsets that were saved earlier
-            self.page_directory[(i, values[RID_COLUMN])] = (page_range_index, page_range.basePageToWrite, page_offsets[i])
+        if transaction is not None:
+            transaction.undo_log.append((self.undo_insert, (values[RID_COLUMN], columns)))
+            transaction.uncommitted_timestamps.append((self, values[RID_COLUMN]))
         return True
     
     """
     # update a record. append a tail page, update indirection columns as needed
     # columns: an array of the columns with values we want the record to be updated to. does not include the 4 metadata columns so we need to calculate those ourselves
     """
-    def update_record(self, primary_key, columns):
+    def update_record(self, primary_key, columns, transaction=None):
         RIDs = self.index.locate(self.key, primary_key) 
         if len(RIDs) == 0: # record does not exist
             return False 
         # if the record exists there should only be one item in the list because primary keys are unique
         baseRID = RIDs[0]
-
-        # read the indirection value's location in the base pages
-        # we do this because we need to access the old version of the record and also link up the new tail page with the old tail page pointer
-        # indirection_pointer = self.read(INDIRECTION_COLUMN, baseRID) # latest tail record
+        # tail records always go into the page range of their base record
+        page_range_index = baseRID // RECORDS_PER_RANGE
 
         # initialize an array with the complete list of data values to insert (metadata values + the record's values)
         values = [None] * METADATA_COLUMNS
         values[INDIRECTION_COLUMN] = None # not needed but included for clarity
-        values[RID_COLUMN] = self.getNewRID()
-        values[TIMESTAMP_COLUMN] = time.time()
+        values[TIMESTAMP_COLUMN] = time.time_ns() if transaction is None else UNCOMMITTED_TIMESTAMP
 
-        # set the schema encoding bits
-        # ensure schema_encoding has length equal to the table's number of columns
-        schema_encoding = ""
+        # set the schema encoding bits, bit i is set if column i is being updated
+        schema_encoding = 0
         for i in range(self.num_columns):
             # if the caller provided a value for this column and it's not None, mark as updated
             if i < len(columns) and (columns[i] is not None):
-                schema_encoding += '1'
-            # column not being updated
-            else:
-                schema_encoding += '0'
+                schema_encoding |= 1 << i
         values[SCHEMA_ENCODING_COLUMN] = schema_encoding
 
-        base_schema = self.read(SCHEMA_ENCODING_COLUMN, baseRID)
-        #base_schema = base_schema.decode()
-
-        # --------- check if first time update, if so, insert that tail record -----------
-        
-        for i in range(len(columns)):
-            if base_schema[i] == '0' and columns[i] != None: # check if this column has ever been updated before, and that we are trying to update it
-                first_update = [None] * (METADATA_COLUMNS + len(columns))
-                first_update[RID_COLUMN] = self.getNewRID()
-
-                new_indirection = self.read(INDIRECTION_COLUMN, baseRID)
-                if new_indirection == None or new_indirection == 0: # base has no updates yet
-                    first_update[INDIRECTION_COLUMN] = baseRID # (1) base rid becomes tail's indirection value
-                else: # base already had an update
-                    first_update[INDIRECTION_COLUMN] = new_indirection  # (1) whatever was in the indirection column of base goes into first_updates indirection
-                self.replace(baseRID, INDIRECTION_COLUMN, first_update[RID_COLUMN]) # (2) update base to newest tail
-                
-                # first_update_schema must reflect all columns (length = num_columns)
-                first_update_schema = ""
-                for j in range(self.num_columns):
-                    if j == i:
-                        first_update_schema += "1"
-                    else:
-                        first_update_schema += "0"
-                first_update[SCHEMA_ENCODING_COLUMN] = first_update_schema
-                first_update[TIMESTAMP_COLUMN] = self.read(TIMESTAMP_COLUMN, baseRID)
-                first_update[i + 4] = self.read(i + 4, baseRID)
-
-                # insert this first update into the tail page
-                
-                page_range_index = self.page_directory.get((RID_COLUMN, baseRID))[0] # uses base RID, RID_COLUMN as a random column to access the page range index of the base record
-                page_range = self.page_ranges[page_range_index]
-                last_tail_page = len(page_range.tail_pages) - 1
-
-                # check for space, might be redundant checking every column
-                for j in range(self.total_columns):
-                    # check if the last tail page fully has room for each column. if any of them don't, we need to allocate a new tail page
-                    if not page_range.tail_pages[last_tail_page][j].has_capacity(8): # len(values[i]) is future proofing  -DH
-                        page_range.allocate_new_tail_page() 
-                        # FIXED: tail_page should be tail_pages
-                        last_tail_page = len(page_range.tail_pages) - 1 # using new tail page
-                        break
-                
-                # can safely write the entire tail record into the tail page of the selected page range
-                page_offsets = [None] * self.total_columns # save the page offsets for each column for later
-                for j in range(self.total_columns):
-                    page_offsets[j] = page_range.tail_pages[last_tail_page][j].page_size # done so since page sizes might differ due to None values
-                    page_range.tail_pages[last_tail_page][j].write(first_update[j]) #write record to the last tail page
-
-                # add the mapping to the page directory
-                page_range_index = self.page_ranges.index(page_range) # find the index of the page range we've been looking at
-                for j in range(self.total_columns):
-                    # the page range index is the one our base record being updated is in
-                    # the page is the first available tail page, so the last one 
-                    # use the page offsets that were saved earlier 
-                    # add MAX_BASE_PAGES offset to distinguish tail pages from base pages
-                    self.page_directory[(j, first_update[RID_COLUMN])] = (page_range_index, last_tail_page + MAX_BASE_PAGES, page_offsets[j])
-
-        # change base record's schema encoding value
-        base_schema_encoding = ""
+        # the indexes of the updated columns need the values being replaced
+        indexed_columns = [0] * self.num_columns
         for i in range(len(columns)):
-            if schema_encoding[i] == '1' or base_schema[i] == '1': # checks if new update updates x column or previous updates have previously done so 
-                base_schema_encoding += '1'
-            else:
-                base_schema_encoding += '0'
-                
-        self.replace(baseRID, SCHEMA_ENCODING_COLUMN, base_schema_encoding)
+            if columns[i] is not None and self.index.is_indexed(i):
+                indexed_columns[i] = 1
+        old_values = self.get_record(baseRID, indexed_columns) if 1 in indexed_columns else []
+        self.begin_change(baseRID, transaction)
 
-        # ready the tail record with new values 
-        values += columns
+        # tail records are appended and linked under the latch, so a merge never counts a tail record the base record doesn't point to yet
+        tail_RIDs = [] # tail records this update appends, so an abort can undo it
+        with self.latch:
+            base_schema = self.read(SCHEMA_ENCODING_COLUMN, baseRID)
+            base_indirection = self.read(INDIRECTION_COLUMN, baseRID)
 
-        # this is redundant, keeping here for reference
-
-        # # this would be the first update to the record, so we need to 
-        # # (1) change the base's indirection pointer from None to our RID 
-        # # (2) set the new tail page's indirection to the base page's RID
-        # if indirection_pointer == None:
-        #     self.replace(baseRID, RID_COLUMN, values[RID_COLUMN])
-        #     values[INDIRECTION_COLUMN] = baseRID # (2)
-        # # if this isn't the first update, then
-        # # (1) set the new tail page's indirection to what was previously contained in the base page
-        # # (2) update the base page's indirection to point to the new tail page's RID
-        # else:
-        #     values[INDIRECTION_COLUMN] = indirection_pointer # (1)
-        #     self.replace(baseRID, RID_COLUMN, values[RID_COLUMN]) # (2)
-
-        # # inserting the actual newest tail record 
-        # # check each column. if it is the first update of that column, we need to insert a tail record that copies the original data
-        # # no matter what, we always have to insert the actual new tail record
+            # --------- check if first time update, if so, insert that tail record -----------
         
+            for i in range(len(columns)):
+                if not base_schema & (1 << i) and columns[i] != None: # check if this column has ever been updated before, and that we are trying to update it
+                    first_update = [None] * (METADATA_COLUMNS + len(columns))
+
+                    new_indirection = self.read(INDIRECTION_COLUMN, baseRID)
+                    if new_indirection == 0: # base has no updates yet
+                        first_update[INDIRECTION_COLUMN] = baseRID # (1) base rid becomes tail's indirection value
+                    else: # base already had an update
+                        first_update[INDIRECTION_COLUMN] = new_indirection  # (1) whatever was in the indirection column of base goes into first_updates indirection
+
+                    # the snapshot only carries the column being updated for the first time
+                    first_update[SCHEMA_ENCODING_COLUMN] = 1 << i
+                    first_update[TIMESTAMP_COLUMN] = self.read(TIMESTAMP_COLUMN, baseRID)
+                    first_update[i + 4] = self.read(i + 4, baseRID)
+
+                    # insert this first update into the tail page
+                    tail_RIDs.append(self.insert_tail_record(page_range_index, first_update, transaction))
+                    self.replace(baseRID, INDIRECTION_COLUMN, first_update[RID_COLUMN], transaction) # (2) update base to newest tail
+
+            # change base record's schema encoding value
+            # a column is marked if this update touches it or previous updates have previously done so
+            base_schema_encoding = base_schema | schema_encoding
 
+            self.replace(baseRID, SCHEMA_ENCODING_COLUMN, base_schema_encoding, transaction)
 
-        #---- adding actual update ----------------------------
+            # ready the tail record with new values 
+            values += columns
+            if self.cumulative:
+                carried = base_schema & ~schema_encoding
+                if carried:
+                    carried_values = iter(self.get_record(baseRID, [(carried >> i) & 1 for i in range(self.num_columns)]))
+                    for i in range(self.num_columns):
+                        if carried & (1 << i):
+                            values[i + METADATA_COLUMNS] = next(carried_values)
+                values[SCHEMA_ENCODING_COLUMN] |= CUMULATIVE_RECORD
 
-        current_base_indirection = self.read(INDIRECTION_COLUMN, baseRID)
-        if current_base_indirection == None or current_base_indirection == 0:
-            values[INDIRECTION_COLUMN] = baseRID  # Point to base if no previous updates
+            #---- adding actual update ----------------------------
+
+            current_base_indirection = self.read(INDIRECTION_COLUMN, baseRID)
+            if current_base_indirection == 0:
+                values[INDIRECTION_COLUMN] = baseRID  # Point to base if no previous updates
+            else:
+                values[INDIRECTION_COLUMN] = current_base_indirection  # Point to previous tail
+
+            # write the tail record into the page range of the base record, then update base to point to it
+            tail_RIDs.append(self.insert_tail_record(page_range_index, values, transaction))
+            self.replace(baseRID, INDIRECTION_COLUMN, values[RID_COLUMN], transaction)
+            #------------------------------------
+
+        # move the record to its new values in the indexes
+        index_changes = [] # (column, old value, new value)
+        old_values = iter(old_values)
+        for i in range(self.num_columns):
+            if indexed_columns[i] == 1:
+                index_changes.append((i, next(old_values), columns[i]))
+                self.index.update_record(baseRID, index_changes[-1][1], columns[i], i)
+
+        if transaction is not None:
+            transaction.undo_log.append((self.undo_update, (baseRID, base_indirection, base_schema, tail_RIDs, index_changes)))
         else:
-            values[INDIRECTION_COLUMN] = current_base_indirection  # Point to previous tail
-        
-        # update base to point to this new tail record
-        self.replace(baseRID, INDIRECTION_COLUMN, values[RID_COLUMN])
-        
-        # get the page range from the base page
-        page_range_index = self.page_directory.get((RID_COLUMN, baseRID))[0] # uses base RID, RID_COLUMN as a random column to access the page range index of the base record
+            self.end_change(baseRID, values[TIMESTAMP_COLUMN])
+
+        # hand the page range to the merge thread once enough tail pages have piled up since its last merge
         page_range = self.page_ranges[page_range_index]
-        last_tail_page = len(page_range.tail_pages) - 1
-        for i in range(self.total_columns):
-            # check if the last tail page fully has room for each column. if any of them don't, we need to allocate a new tail page
-            if not page_range.tail_pages[last_tail_page][i].has_capacity(8): # len(values[i]) is future proofing  -DH
-                page_range.allocate_new_tail_page() 
-                last_tail_page = len(page_range.tail_pages) - 1 # using new tail page
-                break
-        
-        # can safely write the entire tail record into the tail page of the selected page range
-        page_offsets = [None] * self.total_columns # save the page offsets for each column for later
-        for i in range(self.total_columns):
-            page_offsets[i] = page_range.tail_pages[last_tail_page][i].page_size # done so since page sizes might differ due to None values
-            page_range.tail_pages[last_tail_page][i].write(values[i]) #write record to the last tail page       
-
-        # add the values to the index. for now just index the primary key, no secondary keys right now
-        # self.index.insert_record(values[RID_COLUMN], values[self.key], self.key)
-
-        # add the mapping to the page directory
-        page_range_index = self.page_ranges.index(page_range) # find the index of the page range we've been looking at
-        for i in range(self.total_columns):
-            # the page range index is the one our base record being updated is in
-            # the page is the first available tail page, so the last one 
-            # use the page offsets that were saved earlier 
-            # add MAX_BASE_PAGES offset to distinguish tail pages from base pages
-            self.page_directory[(i, values[RID_COLUMN])] = (page_range_index, last_tail_page + MAX_BASE_PAGES, page_offsets[i])
-        #------------------------------------
+        if page_range.num_tail_records - page_range.merged_tail_records >= self.merge_threshold_pages * RECORDS_PER_PAGE:
+            self.request_merge(page_range_index)
+
+        return True
 
+    """
+    # adds amount to one column of a record by appending a delta tail record, without reading the record
+    # increments commute, so transactions holding increment locks on the same record append their deltas side by side
+    # and an abort can't simply unlink its delta (others may sit on top of it): undo_increment appends the opposite one
+    # for the same reason the links to the delta, and the first-update snapshot, are logged as writes of no transaction,
+    # recovery only rolls back the delta itself (see undo)
+    """
+    def increment_record(self, primary_key, column, amount=1, transaction=None):
+        RIDs = self.index.locate(self.key, primary_key)
+        if len(RIDs) == 0: # record does not exist
+            return False
+        baseRID = RIDs[0]
+        timestamp = time.time_ns() if transaction is None else UNCOMMITTED_TIMESTAMP
+        self.begin_change(baseRID, transaction)
+        self.append_delta(baseRID, column, amount, timestamp, transaction)
+        if transaction is not None:
+            transaction.undo_log.append((self.undo_increment, (baseRID, column, amount, transaction)))
+        else:
+            self.end_change(baseRID, timestamp)
         return True
 
-    def delete_record(self, primary_key):
+    # links a delta tail record adding amount to column at the head of the base record's chain
+    # recovery leaves the indexes alone (update_index False), they are rebuilt once it is done
+    # compensation: the delta cancels one of transaction's deltas, see undo_increment
+    def append_delta(self, baseRID, column, amount, timestamp, transaction=None, update_index=True, compensation=False):
+        page_range_index = baseRID // RECORDS_PER_RANGE
+        projected_columns_index = [int(i == column) for i in range(self.num_columns)]
+        with self.latch:
+            # the value the column had after the last delta appended here is still right if nothing was written since
+            runs, head, old_value = self.delta_runs.get((baseRID, column), (0, None, None))
+            if head != self.read(INDIRECTION_COLUMN, baseRID):
+                old_value = None
+            base_schema = self.read(SCHEMA_ENCODING_COLUMN, baseRID)
+            if not base_schema & (1 << column):
+                # the first update of a column keeps its original value in a tail record, like update_record does
+                first_update = [None] * self.total_columns
+                first_update[INDIRECTION_COLUMN] = self.read(INDIRECTION_COLUMN, baseRID) or baseRID
+                first_update[TIMESTAMP_COLUMN] = self.read(TIMESTAMP_COLUMN, baseRID)
+                first_update[SCHEMA_ENCODING_COLUMN] = 1 << column
+                first_update[column + METADATA_COLUMNS] = self.read(column + METADATA_COLUMNS, baseRID)
+                self.replace(baseRID, INDIRECTION_COLUMN, self.insert_tail_record(page_range_index, first_update))
+                if first_update[TIMESTAMP_COLUMN] == UNCOMMITTED_TIMESTAMP and transaction is not None: # the record was inserted by this transaction
+                    transaction.uncommitted_timestamps.append((self, first_update[RID_COLUMN]))
+                self.replace(baseRID, SCHEMA_ENCODING_COLUMN, base_schema | (1 << column))
+            values = [None] * self.total_columns
+            values[INDIRECTION_COLUMN] = self.read(INDIRECTION_COLUMN, baseRID) or baseRID
+            values[TIMESTAMP_COLUMN] = timestamp
+            values[SCHEMA_ENCODING_COLUMN] = DELTA_RECORD | (1 << column) | (COMPENSATION_RECORD if compensation else 0)
+            values[column + METADATA_COLUMNS] = amount
+            head = self.insert_tail_record(page_range_index, values, transaction)
+            self.replace(baseRID, INDIRECTION_COLUMN, head)
+
+            # every FOLD_INTERVAL deltas the column's value is written out, readers never add up more deltas than that
+            # it counts the deltas of running transactions too, one that aborts later cancels its delta above it
+            runs += 1
+            indexed = update_index and self.index.is_indexed(column)
+            if old_value is None and (indexed or runs >= FOLD_INTERVAL):
+                old_value = self.get_record(baseRID, projected_columns_index)[0] - amount
+            if indexed:
+                # an indexed column moves in its index
+                self.index.update_record(baseRID, old_value, old_value + amount, column)
+            if runs >= FOLD_INTERVAL:
+                folded = [None] * self.total_columns
+                folded[INDIRECTION_COLUMN] = head
+                folded[TIMESTAMP_COLUMN] = UNCOMMITTED_TIMESTAMP
+                folded[SCHEMA_ENCODING_COLUMN] = FOLDED_RECORD | (1 << column)
+                folded[column + METADATA_COLUMNS] = old_value + amount
+                head = self.insert_tail_record(page_range_index, folded)
+                self.replace(baseRID, INDIRECTION_COLUMN, head)
+                runs = 0
+            self.delta_runs[(baseRID, column)] = (runs, head, old_value + amount if old_value is not None else None)
+
+        page_range = self.page_ranges[page_range_index]
+        if page_range.num_tail_records - page_range.merged_tail_records >= self.merge_threshold_pages * RECORDS_PER_PAGE:
+            self.request_merge(page_range_index)
+
+    """
+    # appends a tail record to the given page range and records where it went in the tail directory
+    # assigns the tail RID here so that tail RIDs and tail directory entries stay in the same order
+    # tail records written by a transaction stay uncommitted (and out of merges) until it ends, see end_transaction
+    """
+    def insert_tail_record(self, page_range_index, values, transaction=None):
+        values[RID_COLUMN] = self.getNewTailRID()
+        page_range = self.page_ranges[page_range_index]
+        self.log(transaction, TAIL_RECORD, values[RID_COLUMN], page_range_index, page_range.num_tail_records, page_range.num_tail_values, values)
+        offset, position = page_range.insert_to_tail_page(values, self.tail_values(values))
+        self.tail_directory.append((page_range_index << 32) | offset)
+        self.tail_value_directory.append(position)
+        if transaction is not None:
+            page_range.uncommitted.add(offset)
+            transaction.tail_records.append((self, page_range_index, offset))
+            if values[TIMESTAMP_COLUMN] == UNCOMMITTED_TIMESTAMP:
+                transaction.uncommitted_timestamps.append((self, values[RID_COLUMN]))
+        return values[RID_COLUMN]
+
+    """
+    # what a tail record keeps of its data columns: the values of the columns its schema encoding names, in column order
+    # a cumulative record holds more columns than it updates, so its values start with the mask of the columns it holds
+    # values: the record's full list of values, None for the columns it doesn't hold
+    """
+    def tail_values(self, values):
+        schema = values[SCHEMA_ENCODING_COLUMN]
+        held = schema & ((1 << self.num_columns) - 1)
+        tail_values = []
+        if schema & CUMULATIVE_RECORD:
+            for i in range(self.num_columns):
+                if values[i + METADATA_COLUMNS] is not None:
+                    held |= 1 << i
+            tail_values.append(held)
+        for i in range(self.num_columns):
+            if held & (1 << i):
+                tail_values.append(values[i + METADATA_COLUMNS] if values[i + METADATA_COLUMNS] is not None else 0)
+        return tail_values
+
+    """
+    # returns (page range index, position of the first value, mask of the columns held) of the tail record with the given
+    # RID and schema encoding. the value of held column i is at position + the number of held columns before i
+    """
+    def tail_value_layout(self, RID, schema):
+        page_range_index = self.tail_directory[RID - self.tail_directory_start] >> 32
+        position = self.tail_value_directory[RID - self.tail_directory_start]
+        if schema & CUMULATIVE_RECORD:
+            return page_range_index, position + 1, self.read_tail_value(page_range_index, position)
+        return page_range_index, position, schema & ((1 << self.num_columns) - 1)
+
+    # returns the tail value at position in the given page range
+    def read_tail_value(self, page_range_index, position):
+        page = self.page_ranges[page_range_index].tail_value_pages[position // RECORDS_PER_PAGE]
+        self.bufferpool.pin(page)
+        value = page.get(position % RECORDS_PER_PAGE)
+        self.bufferpool.unpin(page)
+        return value
+
+    def delete_record(self, primary_key, transaction=None):
         RIDs = self.index.locate(self.key, primary_key) 
         if len(RIDs) == 0: # record does not exist
             return False 
         baseRID = RIDs[0]
+        self.begin_change(baseRID, transaction)
+
+        # take the record out of the indexes, they hold its latest values. once its key is gone the key can be inserted again
+        indexed_columns = [0] * self.num_columns
+        for i in range(self.num_columns):
+            if self.index.is_indexed(i):
+                indexed_columns[i] = 1
+        index_entries = [] # (column, value)
+        latest_values = iter(self.get_record(baseRID, indexed_columns))
+        for i in range(self.num_columns):
+            if indexed_columns[i] == 1:
+                index_entries.append((i, next(latest_values)))
+                self.index.delete_record(baseRID, index_entries[-1][1], i)
+
+        # until the transaction ends, vacuum keeps the record's tail records and merges keep bringing it up to date
+        if transaction is not None:
+            with self.latch:
+                self.page_ranges[baseRID // RECORDS_PER_RANGE].uncommitted_deletes.add(baseRID)
+            transaction.deletes.append((self, baseRID))
+
         record_to_delete = self.read(INDIRECTION_COLUMN, baseRID) # get the newest tail
         
         while 1:
@@ -278,72 +454,808 @@ class Table:
             if record_to_delete == None or record_to_delete == 0: # if no tail records
                 break
             next_record = self.read(INDIRECTION_COLUMN, record_to_delete) # save the next record down the pointer stream
-            self.replace(record_to_delete, RID_COLUMN, self.read(RID_COLUMN, record_to_delete) * -1) # multiply by -1 to mark for deletion
+            self.replace(record_to_delete, RID_COLUMN, ~record_to_delete, transaction) # mark for deletion, see deleted_RID
             record_to_delete = next_record # move onto the next record
             if next_record == baseRID: # if we reach base record
                 break
-        self.replace(baseRID, RID_COLUMN, baseRID * -1) # mark base record for death.
+        self.replace(baseRID, RID_COLUMN, ~baseRID, transaction) # mark base record for death.
 
+        if transaction is not None:
+            transaction.undo_log.append((self.undo_delete, (baseRID, index_entries)))
+        else:
+            self.end_change(baseRID, time.time_ns())
         return True
 
+    """
+    # a write of the record starts, before its indexes move. a transaction ends it when it commits or aborts (see Transaction.end),
+    # other writes end it themselves once they are done
+    """
+    def begin_change(self, baseRID, transaction=None):
+        with self.latch:
+            self.changed.setdefault(baseRID, [0, 0])[1] += 1
+        if transaction is not None:
+            transaction.changes.append((self, baseRID))
 
+    """
+    # a write of the record ended, committed at timestamp (None if it was rolled back, the record is back to what it was)
+    # the snapshots running now started before the commit and find the record here, once none are left nobody needs the entry
+    """
+    def end_change(self, baseRID, timestamp=None):
+        with self.latch:
+            change = self.changed.get(baseRID)
+            if change is None:
+                return
+            if timestamp is not None:
+                change[0] = max(change[0], timestamp)
+            change[1] -= 1
+            oldest = oldest_snapshot()
+            if change[1] == 0 and (oldest is None or change[0] <= oldest):
+                del self.changed[baseRID]
 
-    # replaces value in specified column and RID
-    def replace(self, RID, column_for_replace, value): 
-        location = self.page_directory.get((column_for_replace, RID))
-        page_range_index = location[0]
-        page_index = location[1]
-        page_offset = location[2]
-        
-        
+    # forgets the records no running write holds and no running snapshot is older than the last commit of
+    def prune_changed(self):
+        oldest = oldest_snapshot()
+        with self.latch:
+            for RID, (timestamp, writes) in list(self.changed.items()):
+                if writes == 0 and (oldest is None or timestamp <= oldest):
+                    del self.changed[RID]
+
+    """
+    # undo functions, a transaction calls them newest first when it aborts. each reverses exactly one insert, update or delete,
+    # so rolling back costs as much as the writes did. the transaction still holds its locks, nobody else has seen these writes
+    """
+    # the record is deleted again, vacuum reclaims it like any deleted record
+    def undo_insert(self, RID, columns):
+        for i in range(self.num_columns):
+            self.index.remove_record(RID, columns[i], i)
+        self.replace(RID, RID_COLUMN, ~RID)
+
+    # the base record goes back to the indirection and schema it had, the tail records are marked deleted so vacuum drops them
+    def undo_update(self, baseRID, indirection, schema, tail_RIDs, index_changes):
+        with self.latch:
+            self.replace(baseRID, INDIRECTION_COLUMN, indirection)
+            self.replace(baseRID, SCHEMA_ENCODING_COLUMN, schema)
+            for RID in tail_RIDs:
+                self.replace(RID, RID_COLUMN, ~RID)
+        for column, old_value, new_value in index_changes:
+            self.index.update_record(baseRID, new_value, old_value, column)
+
+    # the delta is cancelled by one that subtracts the amount again. both keep the uncommitted timestamp, snapshots never see them
+    # the cancelling delta is logged as the transaction's compensation record: if the log keeps it but loses the abort record,
+    # recovery knows this delta is cancelled already and doesn't cancel it a second time (see Database.recover)
+    def undo_increment(self, baseRID, column, amount, transaction=None):
+        self.append_delta(baseRID, column, -amount, UNCOMMITTED_TIMESTAMP, transaction, compensation=True)
+
+    # the deletion marks come off the record and its tail records, and it goes back into the indexes
+    def undo_delete(self, baseRID, index_entries):
+        self.replace(baseRID, RID_COLUMN, baseRID)
+        RID = self.read(INDIRECTION_COLUMN, baseRID)
+        while RID >= TAIL_RID_START:
+            self.replace(RID, RID_COLUMN, RID)
+            RID = self.read(INDIRECTION_COLUMN, RID)
+        for column, value in index_entries:
+            self.index.insert_record(baseRID, value, column)
+
+    """
+    # recovery. the redo functions repeat a logged write on top of whatever the checkpoint and the page files hold
+    # they set values in place instead of appending, so repeating a write that had already reached disk changes nothing
+    # record: a write record from the log without its lsn, type, transaction and table fields
+    """
+    def redo(self, record_type, record):
+        if record_type == BASE_RECORD:
+            RID, values = record
+            page_range_index, page_index, slot = self.locate_record(RID)
+            while len(self.page_ranges) <= page_range_index:
+                self.page_ranges.append(PageRange(self.total_columns, self.allocate_page, self.bufferpool))
+            page_range = self.page_ranges[page_range_index]
+            if page_range.base_pages[page_index] is None:
+                page_range.allocate_new_base_page(page_index)
+            if self.redo_write(page_range.base_pages[page_index], slot, values):
+                page_range.num_base_records += 1
+            self.RID_counter = max(self.RID_counter, RID + 1)
+        elif record_type == TAIL_RECORD:
+            RID, page_range_index, offset, position, values = record
+            page_range = self.page_ranges[page_range_index]
+            while len(page_range.tail_pages) * RECORDS_PER_PAGE <= offset:
+                page_range.allocate_new_tail_page()
+            self.redo_write(page_range.tail_pages[offset // RECORDS_PER_PAGE], offset % RECORDS_PER_PAGE, values)
+            page_range.num_tail_records = max(page_range.num_tail_records, offset + 1)
+            page_range.write_tail_values(position, self.tail_values(values))
+            while len(self.tail_directory) <= RID - self.tail_directory_start:
+                self.tail_directory.append(-1)
+                self.tail_value_directory.append(-1)
+            self.tail_directory[RID - self.tail_directory_start] = (page_range_index << 32) | offset
+            self.tail_value_directory[RID - self.tail_directory_start] = position
+            self.tail_RID_counter = max(self.tail_RID_counter, RID + 1)
+        elif record_type == SET_VALUE:
+            RID, column, old_value, new_value = record
+            self.replace(RID, column, new_value)
+
+    # writes a record's values into a slot of its pages (a tail record's metadata columns only). returns True if the slot was past the records the pages held
+    def redo_write(self, pages, slot, values):
+        self.bufferpool.pin_all(pages)
+        new = slot >= pages[RID_COLUMN].num_records
+        for column in range(len(pages)):
+            pages[column].set(slot, values[column] if values[column] is not None else 0)
+            pages[column].num_records = max(pages[column].num_records, slot + 1)
+        self.bufferpool.unpin_all(pages)
+        return new
+
+    """
+    # for recovery: COMPENSATION_RECORD if record logs a delta an abort appended to cancel another, DELTA_RECORD if it logs
+    # any other delta, 0 otherwise
+    """
+    def delta_type(self, record_type, record):
+        if record_type != TAIL_RECORD or not record[4][SCHEMA_ENCODING_COLUMN] & DELTA_RECORD:
+            return 0
+        return record[4][SCHEMA_ENCODING_COLUMN] & COMPENSATION_RECORD or DELTA_RECORD
+
+    """
+    # rolls back a logged write of a transaction that never finished, recovery calls it after every record has been redone
+    """
+    def undo(self, record_type, record):
+        if record_type == SET_VALUE:
+            RID, column, old_value, new_value = record
+            self.replace(RID, column, old_value)
+        elif record_type == TAIL_RECORD and record[4][SCHEMA_ENCODING_COLUMN] & DELTA_RECORD:
+            # a delta stays linked, other transactions' deltas may be on top of it. the opposite delta cancels it
+            RID, page_range_index, offset, position, values = record
+            baseRID = RID
+            while baseRID >= TAIL_RID_START:
+                baseRID = self.read(INDIRECTION_COLUMN, baseRID)
+            for column in range(self.num_columns):
+                if values[SCHEMA_ENCODING_COLUMN] & (1 << column):
+                    self.append_delta(baseRID, column, -values[column + METADATA_COLUMNS], UNCOMMITTED_TIMESTAMP, update_index=False)
+        else: # base and tail records are marked deleted, vacuum reclaims them
+            RID = record[0]
+            self.replace(RID, RID_COLUMN, ~RID)
+
+    """
+    # called once a transaction has committed or rolled back, its tail records can be merged from now on
+    # and the records it deleted can be vacuumed
+    # tail_records: (page range index, offset) of each tail record it wrote to this table
+    # deletes: base RIDs of the records it deleted in this table
+    """
+    def end_transaction(self, tail_records, deletes=()):
+        with self.latch:
+            for page_range_index, offset in tail_records:
+                self.page_ranges[page_range_index].uncommitted.discard(offset)
+            for RID in deletes:
+                self.page_ranges[RID // RECORDS_PER_RANGE].uncommitted_deletes.discard(RID)
+
+
+
+    """
+    # returns (page range index, page index, slot) of a record
+    # base RIDs map onto their location arithmetically, tail RIDs are looked up in the tail directory
+    # tail page indexes are offset by MAX_BASE_PAGES to distinguish tail pages from base pages
+    """
+    def locate_record(self, RID):
+        if RID < TAIL_RID_START:
+            offset = RID % RECORDS_PER_RANGE
+            return RID // RECORDS_PER_RANGE, offset // RECORDS_PER_PAGE, offset % RECORDS_PER_PAGE
+        location = self.tail_directory[RID - self.tail_directory_start]
+        offset = location & TAIL_OFFSET_MASK
+        return location >> 32, MAX_BASE_PAGES + offset // RECORDS_PER_PAGE, offset % RECORDS_PER_PAGE
+
+    """
+    # returns the page holding the given column of the given location, pinned in the bufferpool (read from disk if it isn't in memory)
+    # the caller must unpin it once it is done with it
+    """
+    def get_page(self, page_range_index, page_index, column):
         page_range = self.page_ranges[page_range_index]
-        # Check if this is a base page (page_index < MAX_BASE_PAGES) or tail page
         if page_index < MAX_BASE_PAGES:
-            page_range.base_pages[page_index][column_for_replace].replace(value, page_offset)
+            page = page_range.base_pages[page_index][column]
         else:
             # For tail pages, need to adjust the index
-            tail_page_index = page_index - MAX_BASE_PAGES if page_index >= MAX_BASE_PAGES else page_index
-            page_range.tail_pages[tail_page_index][column_for_replace].replace(value, page_offset)
+            page = page_range.tail_pages[page_index - MAX_BASE_PAGES][column]
+        self.bufferpool.pin(page)
+        return page
 
-    # passes in column and RID desired, gets address of page range, base page, page offset, returns value 
+    # replaces value in specified column and RID
+    # the old value goes into the log with the new one, recovery needs it to roll back transactions that never finished
+    def replace(self, RID, column_for_replace, value, transaction=None): 
+        page_range_index, page_index, slot = self.locate_record(RID)
+        page = self.get_page(page_range_index, page_index, column_for_replace)
+        with self.latch:
+            self.log(transaction, SET_VALUE, RID, column_for_replace, page.get(slot), value)
+            page.set(slot, value)
+        self.bufferpool.unpin(page)
+
+    """
+    # appends a record describing a write to the write-ahead log, right before the write is made
+    # called under the latch, so a checkpoint (see flush) sees either both the record and the write or neither
+    """
+    def log(self, transaction, record_type, *fields):
+        if self.wal is None:
+            return
+        transaction_id = None
+        if transaction is not None:
+            transaction_id = transaction.id
+            transaction.wals.add(self.wal)
+        self.wal.append(record_type, transaction_id, self.name, *fields)
+
+    # passes in column and RID desired, gets address of page range, base page, slot, returns value 
+    # a data column a tail record doesn't hold reads as 0
     def read(self, column_to_read, RID):
-        location = self.page_directory.get((column_to_read, RID))
-        if location is None:
-            return None
-        page_range_index = location[0]
-        page_index = location[1]
-        page_offset = location[2]
-        
-        page_range = self.page_ranges[page_range_index]
-        if page_index < MAX_BASE_PAGES:
-            read_value = page_range.base_pages[page_index][column_to_read].read(page_offset)
-        else:
-            tail_page_index = page_index - MAX_BASE_PAGES if page_index >= MAX_BASE_PAGES else page_index
-            read_value = page_range.tail_pages[tail_page_index][column_to_read].read(page_offset)
-        
-        # convert bytes to int for all columns except SCHEMA_ENCODING_COLUMN
-        # if read_value is not None and column_to_read != SCHEMA_ENCODING_COLUMN:
-        #     read_value = int.from_bytes(read_value, byteorder='little')
+        if RID >= TAIL_RID_START and column_to_read >= METADATA_COLUMNS:
+            bit = 1 << (column_to_read - METADATA_COLUMNS)
+            page_range_index, position, held = self.tail_value_layout(RID, self.read(SCHEMA_ENCODING_COLUMN, RID))
+            if not held & bit:
+                return 0
+            return self.read_tail_value(page_range_index, position + (held & (bit - 1)).bit_count())
+        page_range_index, page_index, slot = self.locate_record(RID)
+        page = self.get_page(page_range_index, page_index, column_to_read)
+        # every column (schema encoding bits and timestamps included) is stored as a 64 bit integer, so no conversion is needed
+        value = page.get(slot)
+        self.bufferpool.unpin(page)
+        return value
+
+    """
+    # returns a new empty page for the given column, numbered after the last page of that column's page file
+    """
+    def allocate_page(self, column):
+        with self.latch: # the merge thread allocates pages too
+            if self.free_pages[column]:
+                page_number = self.free_pages[column].pop()
+            else:
+                page_number = self.page_counts[column]
+                self.page_counts[column] += 1
+        page = Page(page_number, self.page_files[column])
+        self.bufferpool.add(page)
+        return page
+
+    """
+    # writes every changed page to the page files, then the table's metadata
+    # the metadata is written last (and replaced atomically) so it never describes pages that aren't on disk
+    # the metadata records the checkpoint lsn: every write logged before it is in the pages. writes made while flushing may be too,
+    # which is fine, recovery sets values rather than appending them so repeating those writes changes nothing
+    """
+    def flush(self):
+        if self.path is None:
+            return
+        with self.merge_lock:
+            self.checkpoint()
 
-        if read_value is not None and column_to_read == SCHEMA_ENCODING_COLUMN:
-            read_value = read_value.decode()
-        elif read_value is not None and column_to_read == TIMESTAMP_COLUMN:
-            read_value = struct.unpack('<d', read_value)[0]
-        elif read_value is not None:
-            read_value = int.from_bytes(read_value, byteorder='little')
+    def checkpoint(self):
+        # the metadata is taken together with the checkpoint lsn under the latch, so it describes the table exactly as of that lsn
+        with self.latch:
+            checkpoint_lsn = self.wal.next_lsn if self.wal is not None else self.checkpoint_lsn
+            tail_directory = self.tail_directory.tobytes() + self.tail_value_directory.tobytes()
+            metadata = {
+                'checkpoint_lsn': checkpoint_lsn,
+                'RID_counter': self.RID_counter,
+                'tail_RID_counter': self.tail_RID_counter,
+                'page_counts': list(self.page_counts),
+                'free_pages': [list(free) for free in self.free_pages],
+                'tail_directory_start': self.tail_directory_start,
+                'merge_threshold_pages': self.merge_threshold_pages,
+                'cumulative': self.cumulative,
+                'page_ranges': [page_range.get_metadata() for page_range in self.page_ranges],
+            }
+            retired_pages = self.retired_pages
+            self.retired_pages = [[] for column in range(self.total_columns + 1)]
 
-        
-        return read_value
+        for page_range in self.page_ranges:
+            for page in page_range.pages():
+                if page.dirty:
+                    if self.wal is not None:
+                        self.wal.force_all() # the log is on disk before the pages it describes
+                    self.bufferpool.write_back(page)
+        for page_file in self.page_files:
+            page_file.sync()
+
+        with open(os.path.join(self.path, TAIL_DIRECTORY_FILE + '.tmp'), 'wb') as f:
+            f.write(tail_directory)
+        # the index files carry the same version as the metadata, so a reopen can tell whether they belong to this state of the table
+        metadata['index_version'] = time.time_ns()
+        self.index.save(self.path, metadata['index_version'])
+        metadata['indexes'] = self.index.describe()
+        with open(os.path.join(self.path, METADATA_FILE + '.tmp'), 'w') as f:
+            json.dump(metadata, f)
+        os.replace(os.path.join(self.path, TAIL_DIRECTORY_FILE + '.tmp'), os.path.join(self.path, TAIL_DIRECTORY_FILE))
+        os.replace(os.path.join(self.path, METADATA_FILE + '.tmp'), os.path.join(self.path, METADATA_FILE))
+        self.checkpoint_lsn = checkpoint_lsn
+
+        # pages released before the checkpoint were still part of the previous one, they can be reused from now on
+        with self.latch:
+            for column in range(self.total_columns + 1):
+                self.free_pages[column] += retired_pages[column]
+
+    """
+    # restores the table from the metadata written by flush. only the metadata is read here, pages are read when first touched
+    """
+    def load(self):
+        with open(os.path.join(self.path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        self.RID_counter = metadata['RID_counter']
+        self.tail_RID_counter = metadata['tail_RID_counter']
+        self.checkpoint_lsn = metadata['checkpoint_lsn']
+        self.page_counts = metadata['page_counts']
+        self.free_pages = metadata['free_pages']
+        self.tail_directory_start = metadata['tail_directory_start']
+        self.merge_threshold_pages = metadata['merge_threshold_pages']
+        self.cumulative = metadata['cumulative']
+        self.page_ranges = []
+        for page_range_metadata in metadata['page_ranges']:
+            page_range = PageRange(self.total_columns, self.allocate_page, self.bufferpool)
+            page_range.load_metadata(page_range_metadata, self.page_files)
+            self.page_ranges.append(page_range)
+
+        # the file holds the tail directory followed by the tail value directory
+        self.tail_directory = array('q')
+        self.tail_value_directory = array('q')
+        with open(os.path.join(self.path, TAIL_DIRECTORY_FILE), 'rb') as f:
+            self.tail_directory.fromfile(f, self.tail_RID_counter - self.tail_directory_start)
+            self.tail_value_directory.fromfile(f, self.tail_RID_counter - self.tail_directory_start)
+
+        # indexes are read from their files (or rebuilt if stale) the first time they are needed
+        self.index.load(self.path, metadata['index_version'], metadata['indexes'])
+
+    """
+    # flushes the table and closes its page files
+    """
+    def close(self):
+        self.stop_merging()
+        self.flush()
+        self.bufferpool.discard([page for page_range in self.page_ranges for page in page_range.pages()])
+        for page_file in self.page_files:
+            if page_file is not None:
+                page_file.close()
+
+    """
+    # returns the RIDs of every base record that hasn't been deleted, reading the RID column a base page at a time
+    """
+    def live_RIDs(self):
+        RIDs = []
+        for page_range_index, page_range in enumerate(self.page_ranges):
+            for page_index, base_page in enumerate(page_range.base_pages):
+                if base_page is None:
+                    continue
+                page = self.get_page(page_range_index, page_index, RID_COLUMN)
+                page_start = page_range_index * RECORDS_PER_RANGE + page_index * RECORDS_PER_PAGE
+                for slot, RID in enumerate(page.get_many(range(page.num_records))):
+                    if RID == page_start + slot: # deleted records have their RID negated
+                        RIDs.append(RID)
+                self.bufferpool.unpin(page)
+        return RIDs
+
+    """
+    # reports how many pages the table's page ranges have allocated and how much of that space holds records
+    """
+    def memory_usage(self):
+        allocated_pages = 0
+        bytes_in_use = 0
+        for page_range in self.page_ranges:
+            allocated_pages += page_range.allocated_pages
+            bytes_in_use += page_range.bytes_in_use
+        return {
+            'page_ranges': len(self.page_ranges),
+            'allocated_pages': allocated_pages,
+            'bytes_allocated': allocated_pages * CAPACITY,
+            'bytes_in_use': bytes_in_use,
+        }
 
     def getNewRID(self):
         RID = self.RID_counter
         self.RID_counter += 1
         return RID
 
+    def getNewTailRID(self):
+        RID = self.tail_RID_counter
+        self.tail_RID_counter += 1
+        return RID
+
+
+    """
+    # queues a page range for the background merge thread, starting the thread if needed
+    """
+    def request_merge(self, page_range_index):
+        with self.latch:
+            if page_range_index in self.merges_pending:
+                return
+            self.merges_pending.add(page_range_index)
+            if self.merge_thread is None:
+                self.merge_thread = threading.Thread(target=self.merge_worker, name='merge-' + self.name, daemon=True)
+                self.merge_thread.start()
+        self.merge_queue.put(page_range_index)
+
+    def merge_worker(self):
+        while True:
+            page_range_index = self.merge_queue.get()
+            if page_range_index is None: # told to stop
+                self.merge_queue.task_done()
+                return
+            try:
+                with self.merge_lock:
+                    self.__merge(page_range_index)
+            except Exception as e: # the range is merged again on its next request, the thread keeps serving the others
+                print(f"merge of page range {page_range_index} of table '{self.name}' failed: {e!r}")
+            finally:
+                with self.latch:
+                    self.merges_pending.discard(page_range_index)
+                self.merge_queue.task_done()
+
+    """
+    # waits for queued merges to finish and stops the merge thread
+    """
+    def stop_merging(self):
+        if self.merge_thread is None:
+            return
+        self.merge_queue.put(None)
+        self.merge_thread.join()
+        self.merge_thread = None
+
+    """
+    # consolidates the tail records of a page range into fresh copies of its base pages
+    # only the data columns are rewritten. the metadata columns (indirection, schema...) stay in place, so readers and writers keep going
+    # the new pages replace the old ones one list slot at a time, then the range's tps records the newest tail RID now reflected in the base pages
+    """
+    def __merge(self, page_range_index):
+        page_range = self.page_ranges[page_range_index]
+        tps = page_range.tps
+
+        # everything appended to the range's tail before this point gets merged. later tail records are left for the next merge
+        # taken under the latch so every tail record counted is already linked from its base record
+        # tail records of transactions still running aren't merged, an abort could still take them back
+        with self.latch:
+            merged_tail_records = page_range.num_tail_records
+            if page_range.uncommitted:
+                merged_tail_records = min(page_range.uncommitted)
+        if merged_tail_records <= page_range.merged_tail_records:
+            return
+        last_tail_page = page_range.tail_pages[(merged_tail_records - 1) // RECORDS_PER_PAGE][RID_COLUMN]
+        self.bufferpool.pin(last_tail_page)
+        last_tail_RID = deleted_RID(last_tail_page.get((merged_tail_records - 1) % RECORDS_PER_PAGE))
+        self.bufferpool.unpin(last_tail_page)
+
+        # copy the data columns of every base page that holds records
+        merged_pages = {} # (page index, column) -> new page
+        for page_index, base_page in enumerate(page_range.base_pages):
+            if base_page is None:
+                continue
+            for column in range(METADATA_COLUMNS, self.total_columns):
+                merged_pages[(page_index, column)] = self.copy_page(base_page[column], column)
+
+        # bring every base record up to date with the newest tail values no newer than last_tail_RID
+        # chains are walked from the head and stop at the first tail record the previous merge already consolidated
+        all_columns = (1 << self.num_columns) - 1
+        base_start = page_range_index * RECORDS_PER_RANGE
+        for page_index in range(MAX_BASE_PAGES):
+            if (page_index, METADATA_COLUMNS) not in merged_pages:
+                continue
+            page = self.get_page(page_range_index, page_index, RID_COLUMN)
+            base_RIDs = page.get_many(range(merged_pages[(page_index, METADATA_COLUMNS)].num_records))
+            self.bufferpool.unpin(page)
+            for slot in range(len(base_RIDs)):
+                # deleted records are skipped like live_RIDs does, vacuum may have dropped their tail records already
+                # (unless the delete hasn't committed, an abort brings the record back)
+                if base_RIDs[slot] < 0 and ~base_RIDs[slot] not in page_range.uncommitted_deletes:
+                    continue
+                baseRID = base_start + page_index * RECORDS_PER_PAGE + slot
+                RID = self.read(INDIRECTION_COLUMN, baseRID)
+                pending = all_columns
+                deltas = {} # column -> sum of the deltas above its newest value
+                while RID >= TAIL_RID_START and RID > tps and pending:
+                    if RID <= last_tail_RID:
+                        schema = self.read(SCHEMA_ENCODING_COLUMN, RID)
+                        delta = schema & DELTA_RECORD
+                        present = schema & pending
+                        if not delta:
+                            pending &= ~present
+                        if present:
+                            tail_range_index, position, held = self.tail_value_layout(RID, schema)
+                        column = 0
+                        while present:
+                            if present & 1:
+                                value = self.read_tail_value(tail_range_index, position + (held & ((1 << column) - 1)).bit_count())
+                                if delta:
+                                    deltas[column] = deltas.get(column, 0) + value
+                                else:
+                                    merged_pages[(page_index, column + METADATA_COLUMNS)].set(slot, value + deltas.pop(column, 0))
+                            present >>= 1
+                            column += 1
+                    RID = self.read(INDIRECTION_COLUMN, RID)
+                # deltas whose column has no newer value merged before: the base value is their starting point
+                for column, delta in deltas.items():
+                    merged_page = merged_pages[(page_index, column + METADATA_COLUMNS)]
+                    merged_page.set(slot, merged_page.get(slot) + delta)
+
+        # swap the merged pages in. records inserted while we were merging are copied over first so they aren't lost
+        old_pages = []
+        with self.latch:
+            for (page_index, column), merged_page in merged_pages.items():
+                old_page = page_range.base_pages[page_index][column]
+                if old_page.num_records > merged_page.num_records:
+                    self.bufferpool.pin(old_page)
+                    merged_page.values[merged_page.num_records:old_page.num_records] = old_page.values[merged_page.num_records:old_page.num_records]
+                    merged_page.num_records = old_page.num_records
+                    self.bufferpool.unpin(old_page)
+                page_range.base_pages[page_index][column] = merged_page
+                old_pages.append(old_page)
+                self.retired_pages[column].append(old_page.page_number)
+            # only move the tps once the merged pages are in, a reader that sees the new tps must also see the new pages
+            page_range.tps = last_tail_RID
+            page_range.merged_tail_records = merged_tail_records
+
+        self.bufferpool.unpin_all(merged_pages.values())
+        self.bufferpool.discard(old_pages)
+
+    """
+    # reclaims the space of deleted records
+    # the tail records of deleted records are dropped and the rest of each range's tail records are packed into fresh tail pages,
+    # full base pages holding only deleted records are released, and the page numbers of released pages are reused by later allocations
+    # base RIDs are never handed out again: a base record's RID is its address, so live base records can't be moved
+    # moving tail records isn't logged, so the table is checkpointed before anything else is written to it
+    """
+    def vacuum(self):
+        self.prune_changed()
+        with self.merge_lock, self.latch:
+            for page_range_index in range(len(self.page_ranges)):
+                self.vacuum_page_range(page_range_index)
+
+            # directory entries at the front that only point at dropped tail records are cut off
+            dropped = 0
+            while dropped < len(self.tail_directory) and self.tail_directory[dropped] == -1:
+                dropped += 1
+            del self.tail_directory[:dropped]
+            del self.tail_value_directory[:dropped]
+            self.tail_directory_start += dropped
+
+            self.flush()
+
+    def vacuum_page_range(self, page_range_index):
+        page_range = self.page_ranges[page_range_index]
+
+        # release full base pages whose records are all deleted, no insert will land in them again
+        for page_index, base_page in enumerate(page_range.base_pages):
+            if base_page is None or base_page[RID_COLUMN].num_records < RECORDS_PER_PAGE:
+                continue
+            page = self.get_page(page_range_index, page_index, RID_COLUMN)
+            deleted = all(RID < 0 and ~RID not in self.changed for RID in page.get_many(range(RECORDS_PER_PAGE)))
+            self.bufferpool.unpin(page)
+            if deleted:
+                self.release_pages(base_page)
+                page_range.base_pages[page_index] = None
+                page_range.allocated_pages -= self.total_columns
+                page_range.num_base_records -= RECORDS_PER_PAGE
+
+        # tail records of running transactions are tracked by offset, so their range's tail records stay where they are for now
+        # so do the tail records of records deleted by running transactions, an abort walks their chains to restore them,
+        # and of records that running snapshots can still read older versions of
+        if page_range.uncommitted or any(RID // RECORDS_PER_RANGE == page_range_index for RID in self.changed):
+            return
+
+        # find the tail records still in use, in order. deleted records have every tail record marked
+        kept = [] # (offset, tail RID)
+        for tail_page_index, tail_page in enumerate(page_range.tail_pages):
+            page = tail_page[RID_COLUMN]
+            self.bufferpool.pin(page)
+            for slot, RID in enumerate(page.get_many(range(page.num_records))):
+                if RID >= 0:
+                    kept.append((tail_page_index * RECORDS_PER_PAGE + slot, RID))
+                else:
+                    self.tail_directory[deleted_RID(RID) - self.tail_directory_start] = -1
+                    self.tail_value_directory[deleted_RID(RID) - self.tail_directory_start] = -1
+            self.bufferpool.unpin(page)
+        if len(kept) == page_range.num_tail_records:
+            return
+
+        # read the kept records out column by column, then write them back packed into new tail pages
+        columns = [[] for column in range(METADATA_COLUMNS)]
+        for tail_page_index, tail_page in enumerate(page_range.tail_pages):
+            page_start = tail_page_index * RECORDS_PER_PAGE
+            slots = [offset - page_start for offset, RID in kept if page_start <= offset < page_start + RECORDS_PER_PAGE]
+            self.bufferpool.pin_all(tail_page)
+            for column in range(METADATA_COLUMNS):
+                columns[column] += tail_page[column].get_many(slots)
+            self.bufferpool.unpin_all(tail_page)
+        # and their tail values, packed the same way
+        tail_values = []
+        positions = [] # new position of each kept record's first tail value
+        for (offset, RID), schema in zip(kept, columns[SCHEMA_ENCODING_COLUMN]):
+            start = self.tail_value_directory[RID - self.tail_directory_start]
+            tail_range_index, position, held = self.tail_value_layout(RID, schema)
+            positions.append(len(tail_values))
+            tail_values += [self.read_tail_value(page_range_index, i) for i in range(start, position + held.bit_count())]
+
+        for tail_page in page_range.tail_pages:
+            self.release_pages(tail_page)
+        self.release_pages(page_range.tail_value_pages, self.total_columns)
+        page_range.allocated_pages -= len(page_range.tail_pages) * METADATA_COLUMNS + len(page_range.tail_value_pages)
+        page_range.tail_pages = []
+        page_range.tail_value_pages = []
+        page_range.num_tail_values = 0
+        page_range.write_tail_values(0, tail_values)
+        for start in range(0, len(kept), RECORDS_PER_PAGE):
+            page_range.allocate_new_tail_page()
+            tail_page = page_range.tail_pages[-1]
+            self.bufferpool.pin_all(tail_page)
+            for column in range(METADATA_COLUMNS):
+                values = columns[column][start:start + RECORDS_PER_PAGE]
+                tail_page[column].values[:len(values)] = array('q', values)
+                tail_page[column].num_records = len(values)
+                tail_page[column].dirty = True
+            self.bufferpool.unpin_all(tail_page)
+
+        # tail RIDs don't change, so the version chains stay intact, only the directory learns the new offsets
+        merged_tail_records = 0
+        for new_offset, (offset, RID) in enumerate(kept):
+            self.tail_directory[RID - self.tail_directory_start] = (page_range_index << 32) | new_offset
+            self.tail_value_directory[RID - self.tail_directory_start] = positions[new_offset]
+            if offset < page_range.merged_tail_records:
+                merged_tail_records += 1
+        page_range.merged_tail_records = merged_tail_records
+        page_range.num_tail_records = len(kept)
 
-    def __merge(self):
-        print("merge is happening")
-        pass
+    # drops one page per column from the bufferpool and retires their page numbers
+    # column: the column of every page instead, for pages of a single column
+    def release_pages(self, pages, column=None):
+        self.bufferpool.discard(pages)
+        for i, page in enumerate(pages):
+            self.retired_pages[i if column is None else column].append(page.page_number)
+
+    # returns a copy of the given page of the given column on a newly allocated page. the copy comes back pinned
+    def copy_page(self, page, column):
+        new_page = self.allocate_page(column)
+        self.bufferpool.pin_all((page, new_page))
+        new_page.values[:] = page.values
+        new_page.num_records = page.num_records
+        new_page.dirty = True
+        self.bufferpool.unpin(page)
+        return new_page
+
+    """
+    Reconstructs a record by walking its version chain once.
+    Each projected column is filled in the first time the walk reaches the requested version of it,
+    and the walk stops as soon as every projected column is resolved.
+    """
+    # @param int baseRID: RID of the base record
+    # @param list projected_columns_index: array of 1 or 0 values, what columns to return
+    # @param int version_num: version number to match, where 0 is latest, -1 the one before and so on
+    # @param int snapshot: read timestamp of a snapshot read, tail records committed after it (or not at all) are skipped
+
+    # @return list: values of the projected columns, in column order
+    def get_record(self, baseRID, projected_columns_index, version_num=0, snapshot=None):
+        version_num *= -1
+
+        while True:
+            pending = 0 # bit i is set while column i still needs a value
+            for i in range(len(projected_columns_index)):
+                if projected_columns_index[i] == 1:
+                    pending |= 1 << i
+            values = [None] * self.num_columns
+            counts = [0] * self.num_columns # versions of each column seen so far
+            oldest = [None] * self.num_columns # oldest value of each column seen in the chain
+            deltas = [0] * self.num_columns # sum of the deltas of each column since the version asked for, added to the value found below them
+
+            # the latest version can stop at the first tail record that has been merged, the base pages already hold everything from there on
+            # (a snapshot can be older than the merge, so it can't)
+            tps = self.page_ranges[baseRID // RECORDS_PER_RANGE].tps if version_num == 0 and snapshot is None else 0
+
+            # columns that were never updated (the base schema encoding doesn't have their bit) have no values in the chain
+            base_schema = self.read(SCHEMA_ENCODING_COLUMN, baseRID)
+            unchanged = pending & ~base_schema
+            pending &= base_schema
+            # tail RIDs are all >= TAIL_RID_START, the chain ends when it points back at the base record (or at 0 if there are no updates)
+            RID = self.read(INDIRECTION_COLUMN, baseRID) if pending else 0
+            while pending and RID >= TAIL_RID_START and RID > tps:
+                if snapshot is not None and self.read(TIMESTAMP_COLUMN, RID) > snapshot:
+                    RID = self.read(INDIRECTION_COLUMN, RID)
+                    continue
+                schema = self.read(SCHEMA_ENCODING_COLUMN, RID)
+                # older versions only count committed history: an aborted delta and the one cancelling it are left out together,
+                # and so are folded records, which can include deltas that were never committed
+                if version_num and schema & (DELTA_RECORD | FOLDED_RECORD) and self.read(TIMESTAMP_COLUMN, RID) == UNCOMMITTED_TIMESTAMP:
+                    RID = self.read(INDIRECTION_COLUMN, RID)
+                    continue
+                present = schema & pending
+                # every column still pending was updated by a cumulative record or before it, so the record has its latest value
+                cumulative = schema & CUMULATIVE_RECORD and not version_num
+                if present or cumulative:
+                    tail_range_index, position, held = self.tail_value_layout(RID, schema)
+                    if cumulative:
+                        present = pending & held
+                while present:
+                    bit = present & -present # lowest column present in this tail record
+                    present ^= bit
+                    i = bit.bit_length() - 1
+                    value = self.read_tail_value(tail_range_index, position + (held & (bit - 1)).bit_count())
+                    if counts[i] < version_num: # newer than the version asked for
+                        counts[i] += 1
+                        if not schema & DELTA_RECORD:
+                            oldest[i] = value
+                    elif schema & DELTA_RECORD:
+                        deltas[i] += value
+                    else: # at version number
+                        values[i] = value + deltas[i]
+                        pending ^= bit
+                RID = self.read(INDIRECTION_COLUMN, RID)
+
+            pending |= unchanged
+            with self.latch:
+                # a merge swaps the base pages and moves the tps together under the latch. if it merged this range since the tps
+                # was taken, the new base values may already hold deltas the walk added up, so the walk starts over
+                if version_num == 0 and snapshot is None and self.page_ranges[baseRID // RECORDS_PER_RANGE].tps != tps:
+                    continue
+                i = 0
+                while pending:
+                    if pending & 1:
+                        # asked for a version older than the chain goes back: the oldest tail value is the original one
+                        # (merged base pages hold the latest values, not the original ones). columns never updated come from the base record,
+                        # as do the deltas above the first merged tail record, which add to the base value
+                        values[i] = oldest[i] if oldest[i] is not None else self.read(i + METADATA_COLUMNS, baseRID) + deltas[i]
+                    pending >>= 1
+                    i += 1
+
+            return [values[i] for i in range(len(projected_columns_index)) if projected_columns_index[i] == 1]
+
+    """
+    Returns the given version of one column for many records, for aggregates.
+    RIDs are handled in order, so each base page is pinned once for all of its records and the
+    indirection and column values are read in bulk. Only records updated since their range was
+    last merged (or any updated record when an older version is asked for) walk their chains.
+    """
+    # @param list RIDs: base RIDs of the records
+    # @param int col_idx: index of column
+    # @param int version_num: version number to match, where 0 is latest
+    # @param int snapshot: read timestamp of a snapshot read, see get_record
+
+    # @return list: the column's values, in RID order
+    def get_column_values(self, RIDs, col_idx, version_num=0, snapshot=None):
+        projected_columns_index = [0] * self.num_columns
+        projected_columns_index[col_idx] = 1
+        values = []
+        RIDs = sorted(RIDs)
+        i = 0
+        while i < len(RIDs):
+            # gather the RIDs that live on the same base page
+            page_range_index, page_index, slot = self.locate_record(RIDs[i])
+            page_start = RIDs[i] - slot
+            j = i
+            while j < len(RIDs) and RIDs[j] < page_start + RECORDS_PER_PAGE:
+                j += 1
+            slots = [RID - page_start for RID in RIDs[i:j]]
+
+            # the base value is the answer unless the record has tail records the base pages don't reflect yet
+            # the tps is taken before the base pages: a merge swaps its pages in before it moves the tps, so the pages read
+            # are never older than the tps
+            tps = self.page_ranges[page_range_index].tps if version_num == 0 and snapshot is None else 0
+            indirection_page = self.get_page(page_range_index, page_index, INDIRECTION_COLUMN)
+            column_page = self.get_page(page_range_index, page_index, col_idx + METADATA_COLUMNS)
+            indirections = indirection_page.get_many(slots)
+            base_values = column_page.get_many(slots)
+            self.bufferpool.unpin_all((indirection_page, column_page))
+
+            for k in range(j - i):
+                if indirections[k] > tps:
+                    values.append(self.get_record(RIDs[i + k], projected_columns_index, version_num, snapshot)[0])
+                else:
+                    values.append(base_values[k])
+            i = j
+        return values
+
+    """
+    # returns the base RIDs of the records a snapshot read finds with column in [begin, end]
+    # RIDs: what the indexes find, by the latest values. the records written after the snapshot started (or still being
+    # written) are checked by their value at the snapshot instead: dropped if it is out of range, added if the indexes
+    # missed them because their value moved away or they were deleted. only records committed at the snapshot are kept
+    """
+    def visible_RIDs(self, RIDs, snapshot, column, begin, end):
+        self.prune_changed()
+        with self.latch:
+            changed = [RID for RID, (timestamp, writes) in self.changed.items() if writes or timestamp > snapshot]
+        projected_columns_index = [int(i == column) for i in range(self.num_columns)]
+        candidates = set(RIDs) | set(changed)
+        changed = set(changed)
+        visible = []
+        for RID in sorted(candidates):
+            if self.read(TIMESTAMP_COLUMN, RID) > snapshot:
+                continue
+            if RID in changed and not begin <= self.get_record(RID, projected_columns_index, 0, snapshot)[0] <= end:
+                continue
+            visible.append(RID)
+        return visible
 
     """
     Searches through tail records and returns the contents of a given column that match
@@ -355,39 +1267,12 @@ class Table:
 
     # @return col_contents: int value at column that matches primary key
     def rabbit_hunt(self, col_idx, primary_key, version_num):
-        version_num *= -1
-
-        physical_col_idx = col_idx + METADATA_COLUMNS
-
         # trying to locate by key column instead!!!!!!!!!
         RIDs = self.index.locate(self.key, primary_key)
         if len(RIDs) == 0: # record does not exist
             return None 
         baseRID = RIDs[0] # if the record exists there should only be one item in the list because primary keys are unique
 
-        indirection_RID = self.read(INDIRECTION_COLUMN, baseRID)
-        # check for both 0 and None since we write 0 for "no indirection"
-        if indirection_RID == None or indirection_RID == 0: # base rid becomes tail's indirection value if None or 0
-            indirection_RID = baseRID
-
-        count = 0
-        while baseRID != indirection_RID:
-
-            schema = self.read(SCHEMA_ENCODING_COLUMN, indirection_RID)
-            # schema may be stored as fixed-size bytes, decode and ensure it's at least num_columns long
-            #schema = schema.decode()
-            if len(schema) < self.num_columns:
-                schema = schema + ('0' * (self.num_columns - len(schema)))
-            if schema[col_idx] == '1': # if value @col_idx is present
-                if count == version_num: # at version number, return
-                    col_contents = self.read(physical_col_idx, indirection_RID)
-                    return col_contents
-                count += 1
-                
-            # iterate
-            indirection_RID = self.read(INDIRECTION_COLUMN, indirection_RID)
-
-        # catch all, return base record
-        col_contents = self.read(physical_col_idx, baseRID)
-        return col_contents
- 
\ No newline at end of file
+        projected_columns_index = [0] * self.num_columns
+        projected_columns_index[col_idx] = 1
+        return self.get_record(baseRID, projected_columns_index, version_num)[0]
@@ -1,13 +1,50 @@
-from lstore.table import Table, Record
+from lstore.table import Table, Record, INDIRECTION_COLUMN, RID_COLUMN, TIMESTAMP_COLUMN, METADATA_COLUMNS, running_snapshots, snapshots_latch
+from lstore.lock_manager import SHARED, EXCLUSIVE, INCREMENT
+from lstore.query import KEY_QUERIES, SELECT_QUERIES, SUM_QUERIES
 from lstore.index import Index
+import itertools
+import threading
+import time
+
+# ids are only used to match log records with commits, they just have to differ between runs of transactions
+transaction_ids = itertools.count(1)
+
+# commit and read timestamps come from one clock. a commit stamps its records while holding commit_latch, so a snapshot
+# that gets its read timestamp afterwards sees all of a commit's records or (if it came first) none of them
+commit_latch = threading.Lock()
+last_timestamp = 0
+
+# returns a timestamp later than every one handed out before. the caller holds commit_latch
+def next_timestamp():
+    global last_timestamp
+    last_timestamp = max(last_timestamp + 1, time.time_ns())
+    return last_timestamp
 
 class Transaction:
 
     """
     # Creates a transaction object.
+    # snapshot: run the transaction's selects and sums as snapshot reads. they see the records as they were committed
+    # when the transaction started and take no locks, so they never block writers or abort. writes still lock
     """
-    def __init__(self):
+    def __init__(self, snapshot=False):
         self.queries = []
+        self.locks = {} # lock manager -> names of the locks this transaction holds in it, released when it ends
+        self.undo_log = [] # (undo function, arguments) for every write so far, abort calls them newest first
+        self.tail_records = [] # (table, page range index, offset) of the tail records written so far
+        self.deletes = [] # (table, base RID) of the records deleted so far
+        self.changes = [] # (table, base RID) of every write so far, snapshots find the records through them (see Table.begin_change)
+        self.conflict = False # set when a lock request fails, the transaction can be run again later
+        self.id = None # a new one for every run
+        self.wals = set() # logs holding this run's writes, the commit or abort record goes to each of them
+        self.snapshot = snapshot
+        self.read_timestamp = None # set for every run of a snapshot transaction
+        self.uncommitted_timestamps = [] # (table, RID) of records written so far, their timestamps are set on commit
+        self.optimistic = False # set while an optimistic run reads and buffers its writes, see run
+        self.read_set = {} # (table, primary key) -> (base RID or None if there was no record, indirection seen)
+        self.scans = [] # (table, column, begin, end, base RIDs found) of the index lookups made so far
+        self.write_set = [] # (query, arguments) of the writes buffered so far, in order
+        self.written = {} # (table, primary key) -> all the columns the record has after the buffered writes, None if deleted
         pass
 
     """
@@ -23,21 +60,247 @@ class Transaction:
 
         
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
-    def run(self):
+    # optimistic: run the queries without locks. reads remember the version of each record they saw and writes only go
+    # to the write set, commit then validates the reads and installs the writes, or aborts if a record changed meanwhile
+    def run(self, optimistic=False):
+        database = self.partitioned_database()
+        if database is not None:
+            return database.run(self, optimistic)
+        return self.prepare(optimistic) and self.commit()
+
+    # the PartitionedDatabase the queries belong to, None for queries of an ordinary table
+    # the queries of a partitioned table run in the processes that own its records, which lock them there
+    def partitioned_database(self):
+        owner = getattr(self.queries[0][0], '__self__', None) if self.queries else None
+        if getattr(owner, 'partitioned', False):
+            return owner.database
+        return None
+
+    """
+    # runs the transaction after taking every lock it will need, found by lock_set, in one global order and waiting
+    # for the ones other transactions hold. transactions run this way don't deadlock and don't abort on conflicts
+    # (a record lock_set couldn't foresee is still locked without waiting, losing it aborts as in run)
+    """
+    def run_ordered(self):
+        if self.partitioned_database() is not None:
+            return self.run()
+        self.conflict = False
+        for (table, key), mode in sorted(self.lock_set().items(), key=lambda lock: (lock[0][0].name, lock[0][1])):
+            name = (table.name, key)
+            table.lock_manager.acquire(self, name, mode, wait=True)
+            self.locks.setdefault(table.lock_manager, set()).add(name)
+        return self.prepare() and self.commit()
+
+    """
+    # the record locks the queries will ask for, as far as their arguments tell: (table, primary key) -> mode
+    # records a select finds through another column, or a sum through its key range, are looked up in the indexes now
+    """
+    def lock_set(self):
+        locks = {}
         for query, args in self.queries:
-            result = query(*args)
-            # If the query has failed the transaction should abort
-            if result == False:
+            table = getattr(getattr(query, '__self__', None), 'table', None)
+            method = getattr(query, '__name__', None)
+            if table is None:
+                continue
+            if method == 'increment':
+                keys = [args[0]]
+                mode = INCREMENT
+            elif method in KEY_QUERIES:
+                keys = [args[table.key] if method == 'insert' else args[0]]
+                mode = EXCLUSIVE
+            elif self.snapshot: # snapshot reads don't lock
+                continue
+            elif method in SELECT_QUERIES and args[1] == table.key:
+                keys = [args[0]]
+                mode = SHARED
+            elif method in SELECT_QUERIES:
+                keys = table.get_column_values(table.index.locate(args[1], args[0]), table.key)
+                mode = SHARED
+            elif method in SUM_QUERIES:
+                keys = table.get_column_values(table.index.locate_range(args[0], args[1], table.key), table.key)
+                mode = SHARED
+            else:
+                continue
+            for key in keys:
+                # a record locked in two modes is locked exclusively from the start, waiting for an upgrade could deadlock
+                locks[(table, key)] = mode if locks.get((table, key), mode) == mode else EXCLUSIVE
+        return locks
+
+    """
+    # runs the queries (and validates an optimistic run) without committing. returns True once the transaction
+    # can only commit, its locks are still held. returns False after aborting
+    """
+    def prepare(self, optimistic=False):
+        self.conflict = False
+        self.id = next(transaction_ids)
+        if self.snapshot:
+            with commit_latch:
+                self.read_timestamp = next_timestamp()
+                # the records written from now on stay findable by their values now until this snapshot ends
+                with snapshots_latch:
+                    running_snapshots.add(self.read_timestamp)
+        self.optimistic = optimistic
+        self.read_set = {}
+        self.scans = []
+        self.write_set = []
+        self.written = {}
+        try:
+            for query, args in self.queries:
+                # the query takes its record locks on behalf of this transaction
+                result = query(*args, transaction=self)
+                # If the query has failed the transaction should abort
+                if result == False:
+                    return self.abort()
+            if optimistic and not self.install():
                 return self.abort()
-        return self.commit()
+        except Exception:
+            # a query that crashes has failed too. its writes so far are rolled back and its locks released,
+            # and it is no conflict: running the transaction again would crash the same way
+            self.conflict = False
+            return self.abort()
+        return True
+
+    """
+    # validation and write phase of an optimistic run. the records that were read are locked shared and the written ones
+    # exclusive (by the buffered queries, which now run like those of a locking transaction), so no other transaction
+    # can change them between the check and the commit. returns False, with conflict set, if a record read has changed
+    # or a lookup (the key range of a sum, the value a select searched a column for) would find other records now
+    """
+    def install(self):
+        self.optimistic = False
+        for table, column, begin, end, RIDs in self.scans:
+            found = table.index.locate(column, begin) if begin == end else table.index.locate_range(begin, end, column)
+            if sorted(found) != sorted(RIDs):
+                self.conflict = True
+                return False
+        for (table, key), (RID, version) in self.read_set.items():
+            if not self.lock(table, key, SHARED):
+                return False
+            if RID is None:
+                changed = len(table.index.locate(table.key, key)) > 0
+            else:
+                # an update moves the indirection to its tail record, an abort moves it back and a delete marks the RID
+                changed = table.read(INDIRECTION_COLUMN, RID) != version or table.read(RID_COLUMN, RID) != RID
+            if changed:
+                self.conflict = True
+                return False
+        for query, args in self.write_set:
+            if query(*args, transaction=self) == False:
+                self.conflict = True
+                return False
+        return True
+
+    """
+    # reads a record for an optimistic run, returning the projected columns or None if the run has deleted it
+    # the record's indirection is noted before its values are read: a write that lands in between changes it and fails validation
+    # the latest version of a record the run has written comes from the write set
+    """
+    def read(self, table, baseRID, projected_columns_index, relative_version=0):
+        key = table.read(table.key + METADATA_COLUMNS, baseRID)
+        version = table.read(INDIRECTION_COLUMN, baseRID)
+        self.read_set.setdefault((table, key), (baseRID, version))
+        if relative_version == 0 and (table, key) in self.written:
+            columns = self.written[(table, key)]
+            if columns is None:
+                return None
+            return [columns[i] for i in range(table.num_columns) if projected_columns_index[i] == 1]
+        return table.get_record(baseRID, projected_columns_index, relative_version)
+
+    """
+    # finds the record with the given primary key for an optimistic run, the run's own writes included
+    # returns all its columns or None if there is no such record. a missing record is noted too: validation fails if one appears
+    """
+    def read_key(self, table, key):
+        if (table, key) in self.written:
+            return self.written[(table, key)]
+        RIDs = table.index.locate(table.key, key)
+        if len(RIDs) == 0:
+            self.read_set.setdefault((table, key), (None, None))
+            return None
+        return self.read(table, RIDs[0], [1] * table.num_columns)
+
+    # notes an index lookup of an optimistic run: the records with column in [begin, end] were RIDs
+    def scan(self, table, column, begin, end, RIDs):
+        self.scans.append((table, column, begin, end, list(RIDs)))
+
+    # buffers a write of an optimistic run, columns are all the columns of the record afterwards (None once deleted)
+    def buffer(self, table, key, columns, query, args):
+        self.written[(table, key)] = columns
+        self.write_set.append((query, args))
+
+    """
+    # takes the lock on the record with the given primary key in table, called by the queries of this transaction
+    # returns False if another transaction holds a conflicting lock, the query then fails and the transaction aborts
+    # locks are held until the transaction commits or aborts (strict 2PL)
+    """
+    def lock(self, table, key, mode):
+        # an optimistic run doesn't lock until it validates
+        if self.optimistic:
+            return True
+        name = (table.name, key)
+        if not table.lock_manager.acquire(self, name, mode):
+            self.conflict = True
+            return False
+        self.locks.setdefault(table.lock_manager, set()).add(name)
+        return True
+
+    def release_locks(self):
+        for lock_manager, names in self.locks.items():
+            lock_manager.release(self, names)
+        self.locks = {}
 
     
+    """
+    # rolls back every write of the transaction, newest first, then releases its locks
+    """
     def abort(self):
-        #TODO: do roll-back and any other necessary operations
+        for undo, args in reversed(self.undo_log):
+            undo(*args)
+        for wal in self.wals:
+            wal.abort(self.id)
+        self.end()
         return False
 
     
+    # the transaction has committed once its commit record is on disk, only then are its locks released
+    # its records get the commit timestamp first, from then on snapshots that start later see them
     def commit(self):
-        # TODO: commit to database
+        if self.uncommitted_timestamps or self.changes:
+            with commit_latch:
+                commit_timestamp = next_timestamp()
+                for table, RID in self.uncommitted_timestamps:
+                    table.replace(RID, TIMESTAMP_COLUMN, commit_timestamp, self)
+                for table, RID in self.changes:
+                    table.end_change(RID, commit_timestamp)
+                self.changes = []
+        for wal in self.wals:
+            wal.commit(self.id)
+        self.end()
         return True
 
+    # forgets the writes, lets the tail records be merged and releases the locks
+    def end(self):
+        tail_records = {}
+        for table, page_range_index, offset in self.tail_records:
+            tail_records.setdefault(table, []).append((page_range_index, offset))
+        deletes = {}
+        for table, RID in self.deletes:
+            deletes.setdefault(table, []).append(RID)
+        for table in set(tail_records) | set(deletes):
+            table.end_transaction(tail_records.get(table, []), deletes.get(table, []))
+        # the writes left were rolled back
+        for table, RID in self.changes:
+            table.end_change(RID)
+        self.changes = []
+        self.undo_log = []
+        self.tail_records = []
+        self.deletes = []
+        self.wals = set()
+        self.uncommitted_timestamps = []
+        self.optimistic = False
+        if self.read_timestamp is not None:
+            with snapshots_latch:
+                running_snapshots.discard(self.read_timestamp)
+            self.read_timestamp = None
+        self.release_locks()
+
@@ -1,15 +1,29 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+import random
+import threading
+import time
+
+RETRY_DELAY = 0.001 # seconds, the wait before running an aborted transaction again grows up to this times the attempts
+LANES = 4 # threads a deterministic worker runs its transactions on
 
 class TransactionWorker:
 
     """
     # Creates a transaction worker object.
+    # optimistic: run the transactions with optimistic concurrency control instead of locking, see Transaction.run
+    # deterministic: schedule the transactions as one batch instead. they are split into lanes that share no records and
+    # the lanes run side by side, each transaction taking its locks in order and waiting for them (see Transaction.run_ordered)
     """
-    def __init__(self, transactions = []):
+    def __init__(self, transactions = None, optimistic = False, deterministic = False, lanes = LANES):
         self.stats = []
-        self.transactions = transactions
+        self.optimistic = optimistic
+        self.deterministic = deterministic
+        self.lanes = lanes
+        # a default list would be shared by every worker created without one
+        self.transactions = transactions if transactions is not None else []
         self.result = 0
+        self.thread = None
         pass
 
     
@@ -24,21 +38,69 @@ class TransactionWorker:
     Runs all transaction as a thread
     """
     def run(self):
-        pass
-        # here you need to create a thread and call __run
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.start()
     
 
     """
     Waits for the worker to finish
     """
     def join(self):
-        pass
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
 
 
     def __run(self):
-        for transaction in self.transactions:
-            # each transaction returns True if committed or False if aborted
-            self.stats.append(transaction.run())
+        if self.deterministic:
+            lanes = self.schedule()
+            threads = [threading.Thread(target=self.run_lane, args=(lane, True)) for lane in lanes[1:]]
+            for thread in threads:
+                thread.start()
+            if lanes:
+                self.run_lane(lanes[0], True)
+            for thread in threads:
+                thread.join()
+        else:
+            self.run_lane(self.transactions, False)
         # stores the number of transactions that committed
         self.result = len(list(filter(lambda x: x, self.stats)))
 
+    def run_lane(self, transactions, ordered):
+        for transaction in transactions:
+            # each transaction returns True if committed or False if aborted
+            committed = transaction.run_ordered() if ordered else transaction.run(self.optimistic)
+            # a transaction that lost a lock (or failed validation) was rolled back and can be tried again, the record is free once the holder ends
+            # the random wait keeps two transactions that keep colliding from retrying in lockstep
+            attempts = 0
+            while not committed and transaction.conflict:
+                attempts += 1
+                time.sleep(random.random() * RETRY_DELAY * min(attempts, 10))
+                committed = transaction.run_ordered() if ordered else transaction.run(self.optimistic)
+            self.stats.append(committed)
+
+    """
+    # splits the transactions into at most self.lanes lanes, so that transactions locking the same record are in the same lane
+    # and run one after the other, in the order they were added. groups of transactions that share records are dealt
+    # out largest first to the lane with the fewest transactions. the same batch always gets the same lanes
+    """
+    def schedule(self):
+        # union-find over the transactions, joined through the records they lock
+        parent = list(range(len(self.transactions)))
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        owners = {} # record -> first transaction locking it
+        for i, transaction in enumerate(self.transactions):
+            for record in transaction.lock_set():
+                j = owners.setdefault(record, i)
+                parent[find(i)] = find(j)
+        groups = {}
+        for i in range(len(self.transactions)):
+            groups.setdefault(find(i), []).append(i)
+        lanes = [[] for i in range(min(self.lanes, len(groups)))]
+        for group in sorted(groups.values(), key=lambda group: (-len(group), group[0])):
+            min(lanes, key=len).extend(group)
+        return [[self.transactions[i] for i in sorted(lane)] for lane in lanes]
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+
+LOG_FILE = 'wal.log'
+
+# record types. every record starts with [lsn, type, transaction id], the id is None for writes made outside a transaction
+# the write records name their table and are physical: they say which values a record got, so repeating one is harmless
+BASE_RECORD = 'B' # [..., table, RID, values]                                        a base record was inserted
+TAIL_RECORD = 'T' # [..., table, RID, page range index, offset, position, values]    a tail record was appended, its values from position on
+SET_VALUE = 'S'   # [..., table, RID, column, old value, new value]                  one value of a record was replaced
+COMMIT = 'C'
+ABORT = 'A'
+
+"""
+# The redo log of a database, one line of JSON per record in the file LOG_FILE of the database's directory.
+# Records are buffered in memory. force writes and fsyncs them, a transaction commits once its commit record is forced,
+# and the bufferpool and checkpoints force the whole log before they write a page, so a page on disk never holds a write
+# the log on disk doesn't have. group commit: one thread at a time writes and fsyncs everything buffered so far, the commits
+# that arrive meanwhile pile up in the buffer and the next thread to get the turn makes all of them durable with one fsync
+"""
+class WriteAheadLog:
+
+    def __init__(self, path):
+        self.path = os.path.join(path, LOG_FILE)
+        self.file = open(self.path, 'ab')
+        self.next_lsn = 0
+        self.buffer = [] # encoded records not handed to the OS yet
+        self.durable_lsn = 0 # every record before this one is on disk
+        self.active = {} # transaction id -> lsn of its first record, until its commit or abort record is appended
+        self.lock = threading.Lock() # guards the buffer and next_lsn, only held for an append
+        self.flush_lock = threading.Lock() # held by the thread writing the buffer out
+
+    """
+    # returns every record in the log, in order. a crash can cut the last line short, the log ends before it
+    """
+    def read(self):
+        records = []
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    # adds a record to the buffer and returns its lsn
+    def append(self, record_type, transaction_id, *fields):
+        with self.lock:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self.buffer.append(json.dumps([lsn, record_type, transaction_id, *fields]))
+            if record_type == COMMIT or record_type == ABORT:
+                self.active.pop(transaction_id, None)
+            elif transaction_id is not None and transaction_id not in self.active:
+                self.active[transaction_id] = lsn
+        return lsn
+
+    """
+    # the oldest lsn a truncation has to keep so the log can still roll back the transactions that are running
+    # returns lsn if none of them started before it
+    """
+    def oldest_active(self, lsn):
+        with self.lock:
+            return min([lsn] + list(self.active.values()))
+
+    """
+    # writes the buffered records to the log file and fsyncs them. the caller holds flush_lock
+    """
+    def write(self):
+        with self.lock:
+            buffer = self.buffer
+            self.buffer = []
+            end = self.next_lsn
+        if buffer:
+            self.file.write(('\n'.join(buffer) + '\n').encode())
+            self.file.flush()
+        os.fsync(self.file.fileno())
+        self.durable_lsn = end
+
+    # returns once every record appended so far is on disk
+    def force_all(self):
+        self.force(self.next_lsn - 1)
+
+    # returns once every record up to lsn is on disk
+    def force(self, lsn):
+        if self.durable_lsn > lsn:
+            return
+        with self.flush_lock:
+            # the thread that had the turn before us may have made our records durable already
+            if self.durable_lsn > lsn:
+                return
+            self.write()
+
+    def commit(self, transaction_id):
+        self.force(self.append(COMMIT, transaction_id))
+
+    # an aborted transaction has already rolled its writes back, the abort record doesn't have to be durable
+    def abort(self, transaction_id):
+        self.append(ABORT, transaction_id)
+
+    """
+    # drops the records before lsn, once the tables are checkpointed past them
+    """
+    def truncate(self, lsn):
+        with self.flush_lock:
+            self.write()
+            if lsn >= self.next_lsn: # nothing to keep
+                self.file.truncate(0)
+                os.fsync(self.file.fileno())
+                return
+            # every line starts with "[lsn,", the records that are kept are copied without being decoded
+            with open(self.path, 'rb') as log, open(self.path + '.tmp', 'wb') as f:
+                for line in log:
+                    if int(line[1:line.index(b',')]) >= lsn:
+                        f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(self.path + '.tmp', self.path)
+            self.file = open(self.path, 'ab')
+
+    def close(self):
+        with self.flush_lock:
+            self.write()
+        self.file.close()
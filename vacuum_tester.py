@@ -0,0 +1,75 @@
+from lstore.db import Database
+from lstore.query import Query
+
+from random import randint, seed
+
+db = Database()
+db.open('./ECS165')
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+
+# create a query class for the grades table
+query = Query(grades_table)
+
+# merge as soon as a tail page fills up
+grades_table.merge_threshold_pages = 1
+
+records = {}
+number_of_records = 1000
+seed(3562901)
+
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+print("Insert finished")
+
+# update every record, then delete every third one
+for key in records:
+    updated_columns = [None, None, None, None, None]
+    updated_columns[randint(1, 4)] = randint(0, 20)
+    query.update(key, *updated_columns)
+    for i in range(5):
+        if updated_columns[i] is not None:
+            records[key][i] = updated_columns[i]
+deleted_keys = [key for key in records if key % 3 == 0]
+for key in deleted_keys:
+    query.delete(key)
+    del records[key]
+print("Update and delete finished")
+
+# vacuum drops the tail records of the deleted records
+grades_table.vacuum()
+tps_after_vacuum = grades_table.page_ranges[0].tps
+print("Vacuum finished")
+
+# enough updates to merge every page range again, the merges walk past the deleted records
+for round in range(3):
+    for key in records:
+        updated_columns = [None, None, None, None, None]
+        updated_columns[randint(1, 4)] = randint(0, 20)
+        query.update(key, *updated_columns)
+        for i in range(5):
+            if updated_columns[i] is not None:
+                records[key][i] = updated_columns[i]
+grades_table.stop_merging()
+print("Merge finished")
+
+errors = 0
+for key in records:
+    record = query.select(key, 0, [1, 1, 1, 1, 1])[0]
+    if record.columns != records[key]:
+        errors += 1
+        print('select error on', key, ':', record.columns, ', correct:', records[key])
+for key in deleted_keys:
+    if query.select(key, 0, [1, 1, 1, 1, 1]):
+        errors += 1
+        print('select error on deleted key', key)
+if grades_table.page_ranges[0].tps == tps_after_vacuum:
+    errors += 1
+    print('merge error: page range 0 was not merged after the vacuum')
+print("Select finished")
+print("Errors:", errors)
+
+db.close()